@@ -0,0 +1,57 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+datetime_cache_size = int(os.getenv('DATETIME_CACHE_SIZE', '4096')) #parsed values kept, e.g. identical created stamps within a page
+
+# Formats of the STAC datetimes returned by the EODMS API, e.g. 2023-01-01T10:20:30.123Z or 2023-01-01 10:20:30.123456+00:00
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+ISO_SPACE_FORMAT = '%Y-%m-%d %H:%M:%S.%f%z'
+
+iso_datetime = re.compile(r'(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2}):(\d{2})\.(\d{1,6})(?:(Z)|([+-])(\d{2}):?(\d{2}))')
+separator_formats = {'T': ISO_FORMAT, ' ': ISO_SPACE_FORMAT}
+last_formats = {} #formats -> the format that parsed the previous value
+
+
+@lru_cache(maxsize=datetime_cache_size)
+def parse_datetime(value, formats=(ISO_FORMAT,)):
+    """Parse a datetime string like datetime.strptime, trying each format of formats
+    The ISO formats above are parsed with a single regular expression instead of strptime; other values and
+    formats go through strptime, starting with the format that parsed the previous value. Results are memoized
+    in a bounded LRU cache. The formats must be mutually exclusive (a value matches at most one of them).
+    :param value: datetime string, e.g. item_properties['datetime']
+    :param formats: tuple of strptime formats
+    :return: datetime, timezone aware for the %z formats
+    :raises ValueError: the value does not match any format, as strptime does
+    """
+    match = iso_datetime.fullmatch(value)
+    if match and separator_formats[match.group(4)] in formats:
+        try:
+            return build_iso_datetime(match)
+        except ValueError:
+            pass #e.g. month 13, strptime raises the error below
+
+    last_format = last_formats.get(formats)
+    candidates = formats if last_format is None else (last_format,) + tuple(f for f in formats if f != last_format)
+    for date_format in candidates:
+        try:
+            date_obj = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        last_formats[formats] = date_format
+        return date_obj
+    raise ValueError(f"time data {value!r} does not match any of the formats {formats}")
+
+
+def build_iso_datetime(match):
+    year, month, day, _, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+    if utc:
+        tz = timezone.utc
+    else:
+        if int(offset_minutes) > 59:
+            raise ValueError(f'Invalid UTC offset minutes {offset_minutes}')
+        offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+        tz = timezone(-offset if sign == '-' else offset)
+    # %f is right-padded: .5 is 500000 microseconds
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), int(fraction.ljust(6, '0')), tzinfo=tz)
@@ -0,0 +1,226 @@
+from operator import itemgetter
+
+from stac_item import StacItem
+from item_columns import ItemColumns, map_distinct
+from geometry import bbox_polygons, warn_bbox_issues
+from geocore_options import dedup_options, get_links_options_builder, assets_to_properties_options
+
+required_field = object() #default of a spec field the STAC item must have, a missing one raises KeyError
+
+
+class Field:
+    """Hole of a GeoCore sub-document of a mapping spec, filled per item with a StacItem field
+    :param name: StacItem field, e.g. 'datetime'
+    :param formatter: optional function applied to the value, once per distinct value of a batch
+    """
+    __slots__ = ('name', 'formatter')
+
+    def __init__(self, name, formatter=None):
+        self.name = name
+        self.formatter = formatter
+
+
+class ItemMapping:
+    """STAC item to GeoCore mapping of a collection, compiled from a declarative spec
+
+    The collections only differ in the item properties they read and in how the dates are formatted, so each
+    stac_to_geocore module declares a spec and the mapping itself is shared. The spec is a dictionary of:
+    - 'fields': StacItem field -> (path of the value in the STAC item, default). The path is a tuple of keys,
+      e.g. ('properties', 'sar:orbit_state'); default is used when the last key is missing, required_field
+      raises KeyError instead.
+    - 'temporalExtent': GeoCore temporalExtent, merged into the one of the template.
+    - 'date': GeoCore dates (published, created), merged into the ones of the template for the items whose
+      StacItem field 'date_field' is not None.
+    - 'eoFilters': GeoCore eoFilters.
+    - 'disclaimer': (English, French) disclaimer appended to the collection description.
+    The GeoCore sub-documents hold constants, shared by every item, and Field holes filled per item.
+
+    The spec is compiled once, when the module is imported: record() builds the StacItem record of a decoded
+    feature, and bind() returns the mapping function of a page. bind() hoists everything that does not depend
+    on the item: the template, the params and, once per collection, the titles, description, keywords and
+    links builder are merged into a prebuilt properties dictionary, with the keys in the order of the GeoCore
+    documents, that each item copies before setting its own values.
+
+    Usage:
+        item_mapping = ItemMapping(ITEM_MAPPING_SPEC)
+        items = [item_mapping.record(feature) for feature in features]
+        map_items = item_mapping.bind(params, coll_id_dict, template)
+        documents = map_items(items)
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.record = compile_item_record(spec['fields'])
+        # Check the holes of the sub-documents, the templates they are merged into are only known in bind()
+        fields = {}
+        for key in ('date', 'temporalExtent', 'eoFilters'):
+            compile_subdocument(spec[key], None, fields)
+        unknown = [name for name, _ in fields if name not in StacItem.__slots__] + [name for name in spec['fields'] if name not in StacItem.__slots__]
+        if spec['date_field'] not in StacItem.__slots__:
+            unknown.append(spec['date_field'])
+        if unknown:
+            raise ValueError(f'Unknown StacItem fields in the mapping spec: {unknown}')
+
+    def bind(self, params, coll_id_dict, template):
+        """Compile the mapping function of a page
+        :param params: root level parameters, see processor.process_page
+        :param coll_id_dict: collection level keywords, description, and titles from create_coll_dict()
+        :param template: instance of the GeoCore template feature, shared (not copied) by the mapped items
+        :return: function mapping a list of StacItem records to the list of their GeoCore dictionaries (a
+            FeatureCollection of one feature, like update_geocore_dict())
+        """
+        root_name, source = params['root_name'], params['source']
+        template_properties = template['properties']
+        fields = {} #(name, formatter) -> index in the row of item values
+        build_date = subdocument_builder(self.spec['date'], template_properties.get('date'), fields)
+        build_temporal_extent = subdocument_builder(self.spec['temporalExtent'], template_properties.get('temporalExtent'), fields)
+        build_eo_filters = subdocument_builder(self.spec['eoFilters'], template_properties.get('eoFilters'), fields)
+        date_field = self.spec['date_field']
+        disclaimer_en, disclaimer_fr = self.spec['disclaimer']
+
+        feature_skeleton = template.copy()
+        feature_skeleton.update({"properties": None, "geometry": None})
+        geometry_skeleton = template['geometry'].copy()
+        geometry_skeleton.update({"type": 'Polygon', "coordinates": None})
+        other_properties = {
+            "topicCategory": params['topicCategory'],
+            "type": params['type_data'],
+            "spatialRepresentation": params['spatialRepresentation'],
+            "status": params['status'],
+            "maintenance": params['maintenance'],
+            'useLimits': {'en': params['useLimits_en'], 'fr': params['useLimits_fr']},
+            'contact': params['contact'],
+            }
+
+        collections = {} #coll_id -> (properties skeleton, id prefix, titles, links builder)
+        def collection_mapping(coll_id):
+            coll_data = coll_id_dict.get(coll_id, {})
+            title_en = coll_data.get('title', {}).get('en')
+            title_fr = coll_data.get('title', {}).get('fr')
+            description_en = coll_data.get('description', {}).get('en')
+            description_fr = coll_data.get('description', {}).get('fr')
+            keywords_en = coll_data.get('keywords', {}).get('en')
+            keywords_fr = coll_data.get('keywords', {}).get('fr')
+            titles = (title_en, title_fr) if title_en != None and title_fr != None else None
+            # Keys in the order of the GeoCore item documents, the None values are set per item
+            properties = template_properties.copy()
+            properties["id"] = None
+            if titles:
+                properties['title'] = None
+            properties["parentIdentifier"] = source + '-' + coll_id
+            properties['temporalExtent'] = None
+            properties.update(other_properties)
+            properties.update({
+                'options': None,
+                'description': {'en': f"{description_en or ''} {disclaimer_en}", 'fr': f"{description_fr or ''} {disclaimer_fr}"},
+                'keywords': {'en': f"SpatioTemporal Asset Catalog, stac, {keywords_en or ''}", 'fr': f"SpatioTemporal Asset Catalog, stac, {keywords_fr or ''}"},
+                "geometry": None,
+                'sourceSystemName': params['sourceSystemName'],
+                'eoCollection': params['eoCollection'],
+                'eoFilters': None,
+                })
+            return properties, source + '-' + coll_id + '-', titles, get_links_options_builder(root_name, title_en, title_fr, 'item')
+
+        def map_items(items):
+            columns = ItemColumns(items)
+            warn_bbox_issues(columns.column('id'), columns.bboxes)
+            coordinates, geometry_strs = bbox_polygons(columns.bboxes)
+            values = list(zip(*[map_distinct(formatter, columns.column(name)) if formatter else columns.column(name) for name, formatter in fields])) if fields else [()] * len(columns)
+            dates = columns.column(date_field)
+
+            documents = []
+            for row, item in enumerate(items):
+                coll_id = item.collection
+                coll_mapping = collections.get(coll_id)
+                if coll_mapping is None:
+                    coll_mapping = collections[coll_id] = collection_mapping(coll_id)
+                properties_skeleton, id_prefix, titles, links_to_options = coll_mapping
+                item_values = values[row]
+
+                properties_dict = properties_skeleton.copy()
+                properties_dict["id"] = id_prefix + item.id
+                item_title = item.title.replace("_", "-")
+                if titles:
+                    properties_dict['title'] = {'en': 'Record - ' + item_title + '-' + titles[0], 'fr': 'Ficher - ' + item_title + '-' + titles[1]}
+                if dates[row] is not None:
+                    properties_dict['date'] = build_date(item_values)
+                properties_dict['temporalExtent'] = build_temporal_extent(item_values)
+                item_assets = item.assets
+                options_list = links_to_options(item.links, item.id) + (assets_to_properties_options(assets_list=item_assets) if item_assets else [])
+                properties_dict['options'] = dedup_options(options_list) # delete duplicates
+                properties_dict["geometry"] = geometry_strs[row]
+                properties_dict['eoFilters'] = build_eo_filters(item_values)
+
+                geometry_dict = geometry_skeleton.copy()
+                geometry_dict["coordinates"] = coordinates[row]
+                geocore_features_dict = feature_skeleton.copy()
+                geocore_features_dict["properties"] = properties_dict
+                geocore_features_dict["geometry"] = geometry_dict
+                documents.append({"type": "FeatureCollection", "features": [geocore_features_dict]})
+            return documents
+        return map_items
+
+
+def compile_item_record(fields):
+    """Compile the 'fields' of a mapping spec into the function building the StacItem record of a STAC item"""
+    getters = tuple((name, compile_path(path, default)) for name, (path, default) in fields.items())
+    def record(item_dict):
+        return StacItem(**{name: get(item_dict) for name, get in getters})
+    return record
+
+
+def compile_path(path, default):
+    *parents, key = path
+    if default is required_field:
+        def get(item_dict):
+            for parent in parents:
+                item_dict = item_dict.get(parent)
+            return item_dict[key]
+    else:
+        def get(item_dict):
+            for parent in parents:
+                item_dict = item_dict.get(parent)
+            return item_dict.get(key, default)
+    return get
+
+
+def subdocument_builder(spec, template, fields):
+    """Function (item values) -> GeoCore sub-document of the spec, see compile_subdocument()"""
+    build, constant = compile_subdocument(spec, template, fields)
+    return build if build is not None else lambda values: constant
+
+
+def compile_subdocument(spec, template, fields):
+    """Compile the spec of a GeoCore sub-document
+    Dictionaries are merged into the template sub-document at the same place, other values replace it. The
+    parts without Field holes are built once and shared by every item, only the dictionaries and lists holding
+    holes are copied per item.
+    :param spec: e.g. {'begin': Field('datetime', item_begin_date), 'end': 'Present'}
+    :param template: sub-document of the template at the same place, None if the template does not have it
+    :param fields: dictionary (name, formatter) -> index in the row of item values, completed with the new fields
+    :return: tuple of the function (item values) -> sub-document, None if the sub-document is a constant, and
+        the constant
+    """
+    if isinstance(spec, Field):
+        return itemgetter(fields.setdefault((spec.name, spec.formatter), len(fields))), None
+    if isinstance(spec, dict):
+        skeleton = dict(template) if isinstance(template, dict) else {}
+        members = [(key, value, skeleton.get(key)) for key, value in spec.items()]
+    elif isinstance(spec, list):
+        skeleton = [None] * len(spec)
+        members = [(index, value, None) for index, value in enumerate(spec)]
+    else:
+        return None, spec
+    holes = []
+    for key, value, template_value in members:
+        build, skeleton[key] = compile_subdocument(value, template_value, fields)
+        if build is not None:
+            holes.append((key, build))
+    if not holes:
+        return None, skeleton
+    def build_subdocument(values):
+        subdocument = skeleton.copy()
+        for key, build in holes:
+            subdocument[key] = build(values)
+        return subdocument
+    return build_subdocument, None
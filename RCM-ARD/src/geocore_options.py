@@ -0,0 +1,141 @@
+dedup_fallback_group = object() #options without a hashable url, compared with each other
+
+
+def option_key(option):
+    """Cheap grouping key of a GeoCore option: equal options have the same url"""
+    if isinstance(option, dict):
+        url = option.get('url')
+        try:
+            hash(url)
+            return url
+        except TypeError:
+            pass #e.g. a list
+    return dedup_fallback_group
+
+
+def dedup_options(options_list):
+    """Delete duplicated options in linear time
+    Same result as [i for n, i in enumerate(options_list) if i not in options_list[n + 1:]]: the last occurrence
+    of each option is kept, at its position in the list. Options are grouped by url, so an option is only
+    compared (with ==, like the expression above) with the options already kept in its group.
+    :param options_list: list of GeoCore options (links and assets)
+    :return: list of options without duplicates
+    """
+    groups = {}
+    unique_options = []
+    for option in reversed(options_list):
+        kept = groups.setdefault(option_key(option), [])
+        if option not in kept:
+            kept.append(option)
+            unique_options.append(option)
+    unique_options.reverse()
+    return unique_options
+
+
+# A function to map STAC links to GeoCore option 
+def links_to_properties_options(links_list, id, root_name, title_en, title_fr, stac_type): 
+    """Mapping STAC Links object to GeoCore features properties options  
+    :param links_list: STAC collection or item links object
+    :param id: collection id or item id 
+    :param api_name_en/api_name_fr: STAC datacube English/French nama, hardcoded variables 
+    :param coll_title: 
+    :param stac_type: item or collection 
+    """   
+    return get_links_options_builder(root_name, title_en, title_fr, stac_type)(links_list, id)
+
+
+links_options_builders = {} #(root_name, title_en, title_fr, stac_type) -> compiled links to options builder
+shared_options_limit = 1024 #shared link options kept per builder
+
+
+def get_links_options_builder(root_name, title_en, title_fr, stac_type):
+    """Return the links to options builder of a collection and stac_type, compiled on first use"""
+    key = (root_name, title_en, title_fr, stac_type)
+    build = links_options_builders.get(key)
+    if build is None:
+        build = links_options_builders.setdefault(key, compile_links_to_options(root_name, title_en, title_fr, stac_type))
+    return build
+
+
+def compile_links_to_options(root_name, title_en, title_fr, stac_type):
+    """Precompile the mapping of STAC links to GeoCore options for a collection and stac_type.
+    
+    The names of the root, parent, collection and items links only depend on the collection, and so do their 
+    links: every item of a page points to the same root and parent. The rel to names table is built once, and 
+    the option of such a link is built the first time it is seen and then shared by every item (the options are 
+    only serialized, never mutated). Only the self link, whose name holds the item id, and links with other rels 
+    are built per item.
+
+    Parameters:
+    - root_name: STAC root English/French name, e.g. 'EODMS Datacube/Cube de données du SGDOT'.
+    - title_en, title_fr: collection titles, used in the parent link name of items.
+    - stac_type: 'root', 'collection' or 'item'.
+
+    Returns:
+    - A function (links_list, id) returning the list of GeoCore options, same as the former per-link mapping.
+    """
+    root_name_en,root_name_fr = root_name.split('/')
+    link_names = {
+        'collection': (None, None),
+        'derived_from': (None, None),
+        'root': ('Root - ' + root_name_en, 'Racine - ' + root_name_fr),
+        'data': ('Collection - ' + root_name_en, 'Collecte - ' + root_name_fr),
+        'parent': ('Parent - ' + title_en if stac_type == 'item' and title_en else 'Parent links', 'Parente - ' + title_fr if stac_type == 'item' and title_fr else 'Parente liens'),
+        'items': ('Items API', 'Éléments la API')
+    }
+    if stac_type == 'root':
+        link_names['self'] = ('Root - ' + root_name_en, 'Racine - ' + root_name_fr)
+    shared_options = {} #(rel, href, type) -> option dictionary
+
+    def build(links_list, id):
+        return_list = []
+        for var in links_list: 
+            rel = var.get('rel')
+            names = link_names.get(rel)
+            if names is None:
+                if rel == 'self':
+                    name_en, name_fr = 'Self - ' + id, 'Soi - ' + id
+                else:
+                    name = var.get('title')
+                    name_en, name_fr = (name if name else 'Unknown', name if name else 'Inconnue')
+                return_list.append(link_to_option(var, name_en, name_fr))
+            elif names[0]:
+                shared_key = (rel, var.get('href'), var.get('type', ''))
+                option_dic = shared_options.get(shared_key)
+                if option_dic is None:
+                    option_dic = link_to_option(var, *names)
+                    if len(shared_options) < shared_options_limit:
+                        shared_options[shared_key] = option_dic
+                return_list.append(option_dic)
+        return (return_list)
+    return build
+
+
+def link_to_option(link, name_en, name_fr):
+    href, type_str = link.get('href'), link.get('type', '').replace(';', ',')
+    return {
+        "url": href,
+        "protocol": 'Unknown',
+        "name": {"en": name_en, "fr": name_fr},
+        "description": {"en": f'unknown;{type_str};eng', "fr": f'unknown;{type_str};fra'}
+    }
+
+
+# A function to map STAC assets to GeoCore option 
+def assets_to_properties_options(assets_list): 
+    """Mapping STAC Links object to GeoCore features properties options  
+    :param assets_list: STAC collection or item assets object
+    :return return list: geocore features properties option list  
+    """ 
+    return_list = []
+    for var_dict in assets_list.values():
+        href, type_str, name = var_dict.get('href'), var_dict.get('type', '').replace(';', ','), var_dict.get('title', 'Unknown/Inconnu')
+        name_en, name_fr = name.split('/') if '/' in name else (name, name)
+        option_dic = {
+            "url": href,
+            "protocol": 'Unknown',
+            "name": {"en": f'Asset - {name_en}', "fr": f'Asset - {name_fr}'},
+            "description": {"en": f'unknown;{type_str};eng', "fr": f'unknown;{type_str};fra'}
+        }
+        return_list.append(option_dic)
+    return return_list
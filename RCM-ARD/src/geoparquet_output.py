@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import get_client
+from geometry import polygon_wkb
+from s3_operations import serialize_compact, list_filenames_s3, upload_file_s3, delete_filelist_s3
+
+# Optional GeoParquet output, pyarrow is provided by the AWSSDKPandas layer
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+parquet_output = os.getenv('PARQUET_OUTPUT', 'false').lower() == 'true' #also write every page as a GeoParquet part file
+parquet_prefix = f"{os.getenv('PARQUET_PREFIX', 'geoparquet/')}{os.getenv('COLLECTION')}/" #prefix of the part files of the collection in the processed data bucket, PARQUET_PREFIX<collection>/
+parquet_compression = os.getenv('PARQUET_COMPRESSION', 'zstd') #compression codec of the GeoParquet files
+merge_concurrency = int(os.getenv('PARQUET_MERGE_CONCURRENCY', '8')) #part files downloaded at the same time by merge_parquet_parts
+
+# Column: path of its value in the GeoCore properties. Dictionaries and lists (e.g. contact, options, eoFilters) are
+# stored as compact JSON strings. The geometry is stored as WKB in 'geometry', with its bbox in 'bbox'.
+parquet_columns = {
+    'id': ('id',),
+    'title_en': ('title', 'en'),
+    'title_fr': ('title', 'fr'),
+    'description_en': ('description', 'en'),
+    'description_fr': ('description', 'fr'),
+    'keywords_en': ('keywords', 'en'),
+    'keywords_fr': ('keywords', 'fr'),
+    'topicCategory': ('topicCategory',),
+    'date_published': ('date', 'published', 'date'),
+    'date_created': ('date', 'created', 'date'),
+    'spatialRepresentation': ('spatialRepresentation',),
+    'type': ('type',),
+    'temporalExtent_begin': ('temporalExtent', 'begin'),
+    'temporalExtent_end': ('temporalExtent', 'end'),
+    'status': ('status',),
+    'maintenance': ('maintenance',),
+    'parentIdentifier': ('parentIdentifier',),
+    'contact': ('contact',),
+    'options': ('options',),
+    'useLimits_en': ('useLimits', 'en'),
+    'useLimits_fr': ('useLimits', 'fr'),
+    'sourceSystemName': ('sourceSystemName',),
+    'eoCollection': ('eoCollection',),
+    'eoFilters': ('eoFilters',),
+}
+bbox_keys = ('xmin', 'ymin', 'xmax', 'ymax')
+
+
+def geoparquet_schema():
+    """Arrow schema of the part files and of the merged file, with the GeoParquet 1.1 metadata
+    The geometries are lon/lat (the default CRS, OGC:CRS84) polygons, 'bbox' is their covering column.
+    """
+    fields = [pyarrow.field(name, pyarrow.string()) for name in parquet_columns]
+    fields.append(pyarrow.field('geometry', pyarrow.binary()))
+    fields.append(pyarrow.field('bbox', pyarrow.struct([(key, pyarrow.float64()) for key in bbox_keys])))
+    geo = {
+        "version": "1.1.0",
+        "primary_column": "geometry",
+        "columns": {
+            "geometry": {
+                "encoding": "WKB",
+                "geometry_types": ["Polygon"],
+                "covering": {"bbox": {key: ["bbox", key] for key in bbox_keys}}
+                }
+            }
+        }
+    return pyarrow.schema(fields, metadata={b'geo': json.dumps(geo).encode('utf-8')})
+
+
+def column_value(properties, path):
+    value = properties
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    if value is None or isinstance(value, str):
+        return value
+    return serialize_compact(value).decode('utf-8')
+
+
+class GeoParquetPageWriter:
+    """Write the GeoCore documents of a page as one GeoParquet part file
+
+    The columns of parquet_columns are read from the GeoCore properties of every document, the polygon of the
+    feature geometry is encoded as WKB, with its bbox. Every part file has the same schema, see geoparquet_schema(),
+    and is a single row group, so the gather step concatenates the part files (merge_parquet_parts) without
+    parsing any GeoCore JSON. The documents received already serialized (from the mapping pool) are decoded.
+
+    Usage:
+        parquet_file = GeoParquetPageWriter('eodms-sentinel-1-page-3-0')
+        for item_name, geocore_dict in documents:
+            parquet_file.add((item_name, geocore_dict))
+        key, body = parquet_file.close()
+    """
+
+    def __init__(self, name):
+        if pyarrow is None:
+            raise ValueError('PARQUET_OUTPUT requires pyarrow (AWSSDKPandas layer)')
+        self.key = parquet_prefix + name + '.parquet'
+        self.columns = {column: [] for column in parquet_columns}
+        self.geometries = []
+        self.bboxes = []
+        self.count = 0
+
+    def add(self, mapped):
+        """Append a mapped document
+        :param mapped: tuple of the per-item file name and the GeoCore dictionary, or its JSON bytes
+        """
+        _, json_data = mapped
+        geocore_dict = json.loads(json_data) if isinstance(json_data, (bytes, bytearray)) else json_data
+        feature = geocore_dict['features'][0]
+        properties = feature['properties']
+        for column, path in parquet_columns.items():
+            self.columns[column].append(column_value(properties, path))
+        coordinates = (feature.get('geometry') or {}).get('coordinates')
+        if coordinates:
+            xs = [point[0] for point in coordinates[0]]
+            ys = [point[1] for point in coordinates[0]]
+            self.geometries.append(polygon_wkb(coordinates))
+            self.bboxes.append({'xmin': min(xs), 'ymin': min(ys), 'xmax': max(xs), 'ymax': max(ys)})
+        else:
+            self.geometries.append(None)
+            self.bboxes.append(None)
+        self.count += 1
+
+    def close(self):
+        """Return the part file
+        :return: tuple of the key and the GeoParquet bytes
+        """
+        schema = geoparquet_schema()
+        arrays = [pyarrow.array(self.columns[column], type=pyarrow.string()) for column in parquet_columns]
+        arrays.append(pyarrow.array(self.geometries, type=pyarrow.binary()))
+        arrays.append(pyarrow.array(self.bboxes, type=schema.field('bbox').type))
+        table = pyarrow.Table.from_arrays(arrays, schema=schema)
+        sink = pyarrow.BufferOutputStream()
+        pyarrow.parquet.write_table(table, sink, row_group_size=max(1, self.count), compression=parquet_compression)
+        return self.key, sink.getvalue().to_pybytes()
+
+
+def conform_table(table, schema):
+    """Columns of table in the order of schema, the columns missing from table (part files of an older schema) are null"""
+    columns = [
+        table.column(field.name) if field.name in table.column_names else pyarrow.nulls(table.num_rows, field.type)
+        for field in schema
+        ]
+    return pyarrow.Table.from_arrays(columns, schema=schema)
+
+
+def merge_parquet_parts(bucket, target_bucket, target_key, keys, prefix=None):
+    """Concatenate the GeoParquet part files of a harvest into one GeoParquet file
+    Only the part files logged in the lastRun files of the finished harvest are merged, see reconcile_harvest(). The
+    other part files under the prefix (left by an upload whose page was not logged, or by a former page layout) would
+    be duplicate or outdated rows, they are deleted. Every part file is appended as it is (one row group per part),
+    without parsing any GeoCore JSON. The parts are downloaded PARQUET_MERGE_CONCURRENCY at a time and the merged file
+    is written to /tmp before its upload, so the memory used does not depend on the number of parts, but /tmp (the
+    ephemeral storage of the gather function) must hold the merged file of the whole collection.
+    :param bucket: bucket of the part files, the processed data bucket
+    :param target_bucket: bucket of the merged file
+    :param target_key: key of the merged file, e.g. 'sentinel1-geoparquet.parquet'
+    :param keys: keys of the part files of the harvest
+    :param prefix: prefix of the part files of the collection, default is PARQUET_PREFIX<collection>/
+    :return: tuple of the number of part files and the number of rows merged, (0, 0) if there is no part file
+    :raises ValueError: the merged file could not be uploaded
+    """
+    if pyarrow is None:
+        raise ValueError('merge_parquet_parts requires pyarrow (AWSSDKPandas layer)')
+    prefix = parquet_prefix if prefix is None else prefix
+    keys = sorted(key for key in set(keys) if key.startswith(prefix) and key.endswith('.parquet'))
+    current_keys = set(keys)
+    obsolete = [key for key in list_filenames_s3(bucket, prefix=prefix) if key not in current_keys]
+    if obsolete:
+        e = delete_filelist_s3(deleted_filelist=obsolete, bucket=bucket)
+        if e is not None:
+            logging.error(e)
+    if not keys:
+        return 0, 0
+    s3_client = get_client('s3')
+    def read_part(key):
+        return s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    window = max(1, merge_concurrency)
+    schema = geoparquet_schema()
+    merged_file = f'/tmp/{os.path.basename(target_key)}'
+    rows = 0
+    try:
+        with pyarrow.parquet.ParquetWriter(merged_file, schema, compression=parquet_compression) as writer, \
+                ThreadPoolExecutor(max_workers=window) as executor:
+            for start in range(0, len(keys), window):
+                for body in executor.map(read_part, keys[start:start + window]):
+                    table = conform_table(pyarrow.parquet.read_table(pyarrow.BufferReader(body)), schema)
+                    writer.write_table(table, row_group_size=max(1, table.num_rows))
+                    rows += table.num_rows
+        if not upload_file_s3(filename=merged_file, bucket=target_bucket, json_data=None, object_name=target_key):
+            raise ValueError(f'Failed to upload {target_key} to bucket {target_bucket}')
+    finally:
+        if os.path.exists(merged_file):
+            os.remove(merged_file)
+    logging.info(f'Merged {len(keys)} part files ({rows} rows) of bucket {bucket} into {target_key}')
+    print(f'Merged {len(keys)} part files ({rows} rows) of bucket {bucket} into {target_key} in bucket {target_bucket}')
+    return len(keys), rows
@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+
+pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '256')) #maximum number of fetched items waiting to be mapped
+
+end_of_stream = object()
+stopped_waiting = object()
+
+
+class FetchFailed:
+    """Carries an exception raised by the fetch stage over to the mapping thread"""
+    def __init__(self, error):
+        self.error = error
+
+
+def run_pipeline(source, map_item, sink, queue_size=None, should_stop=None, map_batch=None, batch_size=None):
+    """Run the processor as a three-stage streaming pipeline: fetch → map → upload
+
+    - fetch: a background thread iterates source (e.g. the features of a STAC item page) into a bounded queue
+    - map: the calling thread takes items from the queue as soon as they are available and maps them
+    - upload: every mapped value is handed to sink, e.g. UploadExecutor.submit which uploads in the
+      background and blocks once too many uploads are in flight
+
+    The bounded queue and the bounded upload stage keep the number of items held in memory constant,
+    whatever the size of the page. If any stage fails, the other stages are stopped and the error is raised.
+    should_stop is checked before every item is mapped, e.g. to stop before the Lambda timeout: the items
+    already mapped have been passed to sink, the next ones are left in the source. It is also checked every second
+    while no item arrives, so a stalled fetch does not hold the pipeline past the deadline (the fetch thread is
+    still joined, so the source must end on its own, e.g. with the read timeout of the request).
+    With map_batch, items are mapped by batches of up to batch_size items instead (e.g. by a columnar engine),
+    and should_stop is checked before every batch.
+
+    :param source: iterable of items, consumed in the fetch thread
+    :param map_item: function mapping an item to the value passed to sink, or to None to skip the item
+    :param sink: function receiving every mapped value, called from the calling thread
+    :param queue_size: maximum number of fetched items waiting to be mapped, default is PIPELINE_QUEUE_SIZE
+    :param should_stop: optional function without arguments, returning True to stop before the next item
+    :param map_batch: optional function mapping a list of items to the list of their values (None to skip an
+        item), used instead of map_item
+    :param batch_size: maximum number of items per map_batch call, default is 1
+    :return: tuple of the number of source items mapped (skipped ones included), and True if the whole
+        source was mapped or False if should_stop interrupted the pipeline
+    """
+    items = queue.Queue(maxsize=max(1, queue_size or pipeline_queue_size))
+    stop = threading.Event()
+
+    def offer(value):
+        # Blocking put that gives up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                items.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def take():
+        # Blocking get that gives up once should_stop is true, e.g. while the fetch is stalled
+        while True:
+            try:
+                return items.get(timeout=1)
+            except queue.Empty:
+                if should_stop and should_stop():
+                    return stopped_waiting
+
+    def fetch():
+        try:
+            for item in source:
+                if not offer(item):
+                    break
+            else:
+                offer(end_of_stream)
+        except BaseException as e:
+            offer(FetchFailed(e))
+        finally:
+            if stop.is_set() and hasattr(source, 'close'):
+                source.close()
+
+    fetch_thread = threading.Thread(target=fetch, name='pipeline-fetch', daemon=True)
+    fetch_thread.start()
+    if map_batch is None:
+        map_batch, batch_size = lambda batch: [map_item(item) for item in batch], 1
+    batch_size = max(1, batch_size or 1)
+    count = 0
+    completed = stopped = False
+    try:
+        while not completed and not stopped and not (should_stop and should_stop()):
+            batch, failed = [], None
+            while len(batch) < batch_size:
+                item = take()
+                if item is stopped_waiting:
+                    stopped = True
+                    break
+                if item is end_of_stream:
+                    completed = True
+                    break
+                if isinstance(item, FetchFailed):
+                    failed = item.error
+                    break
+                batch.append(item)
+            for value in map_batch(batch) if batch else []:
+                if value is not None:
+                    sink(value)
+            count += len(batch)
+            if failed:
+                raise failed
+    finally:
+        stop.set()
+    fetch_thread.join()
+    return count, completed
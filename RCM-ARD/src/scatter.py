@@ -6,6 +6,7 @@ import awswrangler as wr
 from aws_lambda_powertools import Logger
 from dynamo_operations import *
 from s3_operations import * 
+from aws_clients import get_client
 
 logger = Logger()
 
@@ -57,7 +58,7 @@ def lambda_handler(event, context):
     create_item(sg_aggregate_table_name, item)
     
     # For each item-api link send the SQS message queue
-    # We want to Trigger processor_lambda by api links
+    # We want to Trigger processor_lambda by api links, the collector sizes the pages (PAGE_LIMIT) 
     for index, item_link in enumerate(item_json):
         #print(f'the index is {index}, and the api is {item_link["item_api"]}' )
         
@@ -82,7 +83,7 @@ def lambda_handler(event, context):
         }
         
 def send_message_queue(message):
-    sqs_client =boto3.client("sqs")
+    sqs_client = get_client("sqs")
     response = sqs_client.send_message(
         QueueUrl=queue_url,
         MessageBody=str(message)
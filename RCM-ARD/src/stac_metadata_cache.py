@@ -0,0 +1,144 @@
+import requests
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+from s3_operations import open_file_s3, upload_file_s3
+
+# STAC root and /collections documents rarely change, but every collector and processor invocation needs them.
+# They are cached at three levels: module memory (warm container), /tmp (shared by handlers of the same container)
+# and an optional S3 snapshot published by the collector so cold processors do not hit the STAC API either.
+stac_metadata_ttl = int(os.getenv('STAC_METADATA_TTL', '3600')) #seconds before a cached document is revalidated with its ETag
+stac_metadata_dir = os.getenv('STAC_METADATA_CACHE_DIR', '/tmp/stac_metadata')
+stac_metadata_bucket_name = os.getenv('STAC_METADATA_BUCKET_NAME') #optional, bucket of the S3 snapshot
+stac_metadata_snapshot_name = os.getenv('STAC_METADATA_SNAPSHOT_NAME', 'stac_metadata_snapshot.json')
+
+stac_metadata_cache = {} #url -> {"url", "etag", "fetched_at", "data"}
+snapshot_loaded = False
+
+
+def get_stac_json(url, ttl=None):
+    """Return the JSON document of a STAC metadata endpoint (root, /collections/) from the cache
+    A cached document younger than ttl is returned without any request; an older one is revalidated
+    with If-None-Match and only downloaded again if the ETag changed. If the API cannot be reached,
+    the stale copy is served rather than failing the harvest.
+    The returned document is shared with the cache, callers must treat it as read-only.
+    :param url: STAC endpoint url
+    :param ttl: freshness in seconds, default is STAC_METADATA_TTL
+    :return: the decoded JSON document, or None if it is neither cached nor available
+    """
+    ttl = stac_metadata_ttl if ttl is None else ttl
+    entry = get_cache_entry(url)
+    if entry and time.time() - entry['fetched_at'] < ttl:
+        return entry['data']
+
+    headers = {'If-None-Match': entry['etag']} if entry and entry.get('etag') else {}
+    try:
+        r = requests.get(url, headers=headers)
+    except requests.exceptions.RequestException as e:
+        logging.error(f'Connectivity issue while requesting {url}: {e}')
+        return entry['data'] if entry else None
+
+    if r.status_code == 304 and entry:
+        entry['fetched_at'] = time.time()
+        put_cache_entry(entry)
+        return entry['data']
+    if r.status_code == 200:
+        try:
+            data = r.json()
+        except json.JSONDecodeError:
+            print(f"{url} is not in JSON format. Raw response:", r.text)
+            return entry['data'] if entry else None
+        put_cache_entry({"url": url, "etag": r.headers.get('ETag'), "fetched_at": time.time(), "data": data})
+        return data
+
+    print(f'Request failed: {url}. Status code: {r.status_code}. Response: {r.text}')
+    return entry['data'] if entry else None
+
+
+def get_stac_root(api_root, ttl=None):
+    """Return the STAC root (landing page) document, see get_stac_json()"""
+    return get_stac_json(f'{api_root}', ttl=ttl)
+
+
+def get_stac_collections(api_root, ttl=None):
+    """Return the list of collections from the STAC /collections/ endpoint, see get_stac_json()"""
+    collections_json = get_stac_json(f'{api_root}/collections/', ttl=ttl)
+    return collections_json.get('collections', []) if collections_json else []
+
+
+def get_cache_entry(url):
+    """Look a url up in memory, then in /tmp, then in the S3 snapshot (once per container)"""
+    entry = stac_metadata_cache.get(url)
+    if entry:
+        return entry
+    try:
+        with open(cache_path(url), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        stac_metadata_cache[url] = entry
+        return entry
+    except (OSError, json.JSONDecodeError):
+        pass
+    if load_stac_metadata_snapshot():
+        return stac_metadata_cache.get(url)
+    return None
+
+
+def put_cache_entry(entry):
+    """Store a cache entry in memory and /tmp, the /tmp write is atomic so concurrent readers never see a partial file"""
+    stac_metadata_cache[entry['url']] = entry
+    try:
+        os.makedirs(stac_metadata_dir, exist_ok=True)
+        # Every writer has its own temporary file, so concurrent writers (PAGE_CONCURRENCY) never interleave 
+        f = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=stac_metadata_dir, suffix='.part', delete=False)
+        try:
+            with f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(f.name, cache_path(entry['url']))
+        except OSError:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+            raise
+    except OSError as e:
+        logging.error(f'Could not write the STAC metadata cache to {stac_metadata_dir}: {e}')
+
+
+def cache_path(url):
+    return os.path.join(stac_metadata_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def load_stac_metadata_snapshot():
+    """Seed the cache from the S3 snapshot, only the first time it is needed in a container
+    :return: True if the snapshot was loaded
+    """
+    global snapshot_loaded
+    if snapshot_loaded or not stac_metadata_bucket_name:
+        return False
+    snapshot_loaded = True
+    body = open_file_s3(stac_metadata_bucket_name, stac_metadata_snapshot_name)
+    if not body:
+        return False
+    try:
+        entries = json.loads(body)
+    except json.JSONDecodeError as e:
+        logging.error(f'Invalid STAC metadata snapshot {stac_metadata_snapshot_name}: {e}')
+        return False
+    for entry in entries:
+        # Never let the snapshot replace a newer copy already in the cache
+        cached = stac_metadata_cache.get(entry['url'])
+        if not cached or cached['fetched_at'] < entry['fetched_at']:
+            stac_metadata_cache[entry['url']] = entry
+    print(f'Loaded {len(entries)} STAC metadata documents from {stac_metadata_snapshot_name}')
+    return True
+
+
+def publish_stac_metadata_snapshot():
+    """Upload the documents cached in memory as the S3 snapshot, no-op when STAC_METADATA_BUCKET_NAME is not set
+    :return: True if the snapshot was uploaded
+    """
+    if not stac_metadata_bucket_name or not stac_metadata_cache:
+        return False
+    return upload_file_s3(stac_metadata_snapshot_name, bucket=stac_metadata_bucket_name, json_data=list(stac_metadata_cache.values()), object_name=None)
@@ -1,7 +1,13 @@
 import json 
 from datetime import datetime, timedelta
+from types import MappingProxyType
 import re 
 import requests
+from stac_metadata_cache import get_stac_collections
+from geocore_options import dedup_options, links_to_properties_options, get_links_options_builder, assets_to_properties_options
+from geocore_mapping import ItemMapping, Field, required_field
+from geometry import bbox_polygon
+from fast_datetime import parse_datetime, ISO_FORMAT, ISO_SPACE_FORMAT
 
 # Hardcoded variables for the STAC to GeoCore translation 
 status = 'active'
@@ -60,6 +66,40 @@ contact = [{
             'role': None, 
         }]
         
+# GeoCore template instantiation 
+def compile_geocore_template(template):
+    """Precompile a GeoCore template into an immutable skeleton and return a builder for it.
+    
+    The mapping functions below mutate the nested dictionaries of the template in place, so every item needs 
+    its own instance. Compiling once and calling the builder per item replaces re-downloading or deep-copying 
+    the template: scalar values are shared (they are immutable), only the dictionaries and lists are rebuilt.
+
+    Parameters:
+    - template: GeoCore features dictionary, e.g. the null template ['features'][0].
+
+    Returns:
+    - A function without arguments returning a fresh, independent instance of the template.
+    """
+    if isinstance(template, dict):
+        # Keep every key in the skeleton (nested containers as placeholders) so instances preserve the key order 
+        skeleton = MappingProxyType({key: None if isinstance(value, (dict, list)) else value for key, value in template.items()})
+        nested = tuple((key, compile_geocore_template(value)) for key, value in template.items() if isinstance(value, (dict, list)))
+        if not nested:
+            return skeleton.copy
+        def build_dict():
+            instance = skeleton.copy()
+            for key, build in nested:
+                instance[key] = build()
+            return instance
+        return build_dict
+    if isinstance(template, list):
+        if not any(isinstance(value, (dict, list)) for value in template):
+            values = tuple(template)
+            return lambda: list(values)
+        builders = tuple(compile_geocore_template(value) for value in template)
+        return lambda: [build() for build in builders]
+    return lambda: template
+
 # STAC to GeoCore translation functions 
 def update_dict(target_dict, updates):
     """Utility function to update a dictionary with new key-value pairs.
@@ -96,15 +136,15 @@ def update_geocore_dict(geocore_features_dict, properties_dict, geometry_dict):
     }
 
 #stac_to_feature_geometry
-def to_features_geometry(geocore_features_dict, bbox, geometry_type='Polygon'):
+def to_features_geometry(geocore_features_dict, bbox, geometry_type='Polygon', polygon=None):
     """Mapping to GeoCore features geometry field.
     
     :param bbox: list of bounding box [west, south, east, north]
     :param geometry_type: string of item or collection type, default is 'Polygon'
+    :param polygon: optional (coordinates, wkt) of the bbox already computed by bbox_polygon(), so it is rounded once 
     """
     geometry_dict = geocore_features_dict['geometry']
-    west, south, east, north = [round(coord, 2) for coord in bbox]
-    coordinates=[[[west, south], [east, south], [east, north], [west, north], [west, south]]]
+    coordinates, _ = polygon or bbox_polygon(bbox)
     # Update the geometry dictionary
     updates = {
         "type": geometry_type,
@@ -114,58 +154,6 @@ def to_features_geometry(geocore_features_dict, bbox, geometry_type='Polygon'):
     
     return geometry_dict
 
-# A function to map STAC links to GeoCore option 
-def links_to_properties_options(links_list, id, root_name, title_en, title_fr, stac_type): 
-    """Mapping STAC Links object to GeoCore features properties options  
-    :param links_list: STAC collection or item links object
-    :param id: collection id or item id 
-    :param api_name_en/api_name_fr: STAC datacube English/French nama, hardcoded variables 
-    :param coll_title: 
-    :param stac_type: item or collection 
-    """   
-    return_list = []
-    root_name_en,root_name_fr = root_name.split('/')
-    for var in links_list: 
-        href, rel, type_str, name = var.get('href'), var.get('rel'), var.get('type', '').replace(';', ','), var.get('title')
-        name_en, name_fr = {
-            'collection': (None, None),
-            'derived_from': (None, None),
-            'self': ('Self - ' + id if stac_type != 'root' else 'Root - ' + root_name_en, 'Soi - ' + id if stac_type != 'root' else 'Racine - ' + root_name_fr),
-            'root': ('Root - ' + root_name_en, 'Racine - ' + root_name_fr),
-            'data': ('Collection - ' + root_name_en, 'Collecte - ' + root_name_fr),
-            'parent': ('Parent - ' + title_en if stac_type == 'item' and title_en else 'Parent links', 'Parente - ' + title_fr if stac_type == 'item' and title_fr else 'Parente liens'),
-            'items': ('Items API', 'Éléments la API')
-        }.get(rel, (name if name else 'Unknown', name if name else 'Inconnue'))
-                
-        if name_en and name_fr:
-            option_dic = {
-                "url": href,
-                "protocol": 'Unknown',
-                "name": {"en": name_en, "fr": name_fr},
-                "description": {"en": f'unknown;{type_str};eng', "fr": f'unknown;{type_str};fra'}
-            }        
-            return_list.append(option_dic)
-    return (return_list)
-
-# A function to map STAC assets to GeoCore option 
-def assets_to_properties_options(assets_list): 
-    """Mapping STAC Links object to GeoCore features properties options  
-    :param assets_list: STAC collection or item assets object
-    :return return list: geocore features properties option list  
-    """ 
-    return_list = []
-    for var_dict in assets_list.values():
-        href, type_str, name = var_dict.get('href'), var_dict.get('type', '').replace(';', ','), var_dict.get('title', 'Unknown/Inconnu')
-        name_en, name_fr = name.split('/') if '/' in name else (name, name)
-        option_dic = {
-            "url": href,
-            "protocol": 'Unknown',
-            "name": {"en": f'Asset - {name_en}', "fr": f'Asset - {name_fr}'},
-            "description": {"en": f'unknown;{type_str};eng', "fr": f'unknown;{type_str};fra'}
-        }
-        return_list.append(option_dic)
-    return return_list
-
 #root_to_features_properties 
 def root_to_features_properties(params, geocore_features_dict): 
     # Get the parameters 
@@ -198,7 +186,7 @@ def root_to_features_properties(params, geocore_features_dict):
     links_list = links_to_properties_options(links_list=root_links, id=root_id, root_name=root_name, title_en=None, title_fr=None, stac_type='root')
     options_list = links_list
     #print(f'This is option list before delete duplication: {json.dumps(options_list, indent=2)}')
-    options_list = [i for n, i in enumerate(options_list) if i not in options_list[n + 1:]] # delete duplicates
+    options_list = dedup_options(options_list) # delete duplicates
     #print(f'This is option list after delete duplication: {json.dumps(options_list, indent=2)}')
     
     #Descrption 
@@ -275,7 +263,7 @@ def coll_to_features_properties(params, coll_dict,geocore_features_dict):
     links_list = links_to_properties_options(links_list=coll_links, id=coll_id, root_name=root_name, title_en=title_en, title_fr=title_fr, stac_type='collection')
     assets_list = assets_to_properties_options(assets_list=coll_assets) if coll_assets else []
     options_list = links_list+assets_list
-    options_list = [i for n, i in enumerate(options_list) if i not in options_list[n + 1:]] # delete duplicates
+    options_list = dedup_options(options_list) # delete duplicates
 
 
     # The shared attributes between Items and Collections  
@@ -360,8 +348,7 @@ def get_collection_fields(coll_dict,coll_description_en,coll_description_fr,coll
     return coll_id, coll_bbox, time_begin, time_end, coll_links, coll_assets, title_en, title_fr, description_en, description_fr, keywords_en, keywords_fr
 
 def create_coll_dict(api_root, collection, coll_title_fr,coll_description_fr,coll_keywords_fr):
-    response_collection = requests.get(f'{api_root}/collections/')
-    collection_data_list = response_collection.json().get('collections', [])
+    collection_data_list = get_stac_collections(api_root)
     #subset to one collection based on id
     collection_data_list = [item for item in collection_data_list if item.get('id') == collection]
 
@@ -377,147 +364,25 @@ def create_coll_dict(api_root, collection, coll_title_fr,coll_description_fr,col
     return coll_id_dict 
 
 
-#Item_to_features_properties
-def item_to_features_properties(params, geocore_features_dict, item_dict, coll_id_dict):
-    root_name = params['root_name']
-    root_id = params['root_id']
-    source = params['source']
-    status = params['status']
-    maintenance = params['maintenance'] 
-    useLimits_en = params['useLimits_en']
-    useLimits_fr = params['useLimits_fr']
-    spatialRepresentation = params['spatialRepresentation']
-    contact = params['contact']
-    type_data = params['type_data']
-    topicCategory = params['topicCategory']
-    sourceSystemName = params['sourceSystemName']
-    eoCollection = params['eoCollection']
-    
-    properties_dict = geocore_features_dict['properties']
-    # Get item level lelments 
-    item_id, item_bbox, item_links, item_assets, item_properties,coll_id = get_item_fields(item_dict) 
-    
-    # Get collection level keywords, title, and description 
-    coll_data = coll_id_dict.get(coll_id, {})
-    title_en = coll_data.get('title', {}).get('en')
-    title_fr = coll_data.get('title', {}).get('fr')
-    description_en = coll_data.get('description', {}).get('en')
-    description_fr = coll_data.get('description', {}).get('fr')
-    keywords_en = coll_data.get('keywords', {}).get('en')
-    keywords_fr = coll_data.get('keywords', {}).get('fr')
-    
-    #id
-    properties_dict.update({"id": source + '-' + coll_id + '-' + item_id})
-     
-    #date
-    default_date = datetime(1900, 1, 1)  # Replace with a sensible default
+#Item formatters, see ITEM_MAPPING_SPEC 
+def item_begin_date(item_datetime):
+    """temporalExtent begin of an item, from its datetime"""
     try:
-        item_start_date = datetime.strptime(item_properties['datetime'], '%Y-%m-%dT%H:%M:%S.%f%z')
+        item_date = parse_datetime(item_datetime)
     except ValueError:
-        # Handle the exception here
         print("The date format of 'item_properties['datetime']' does not match the expected format.")
-        # You might want to set item_start_date to None or a default value, or re-raise the exception, depending on your use case
-        item_start_date = default_date
-    
+        item_date = datetime(1900, 1, 1)
+    return format_datetime_for_json(item_date)
+
+def item_end_date(item_end_datetime):
+    """temporalExtent end of an item, from its end_datetime"""
     try:
-        item_end_date = datetime.strptime(item_properties['end_datetime'], '%Y-%m-%dT%H:%M:%S.%f%z')
+        item_date = parse_datetime(item_end_datetime)
     except ValueError:
-        # Handle the exception here
         print("The date format of 'item_properties['end_datetime']' does not match the expected format.")
-        # You might want to set item_end_date to None or a default value, or re-raise the exception, depending on your use case
-        item_end_date = 'Present'
+        item_date = 'Present'
+    return format_datetime_for_json(item_date)
 
-    #TODO update the item level title
-    #title
-    item_title = item_properties['title'].replace("_", "-")
-    if title_en != None and title_fr!= None: 
-        update_dict(properties_dict, {'title':{'en':'Record - ' + item_title + '-' + title_en, 'fr':'Ficher - ' + item_title + '-' + title_fr}})
-    #parentIdentifier
-    update_dict(properties_dict, {"parentIdentifier":  source + '-'+ coll_id})
-    
-    #TemporalExtent 
-    if 'created' in item_properties.keys(): 
-        item_created = item_properties['created']
-        update_dict(properties_dict['date']['published'], {
-        "text": 'publication; publication',
-        "date": format_datetime_for_json(item_created)
-        })
-        
-        update_dict(properties_dict['date']['created'], {
-        "text": 'creation; création',
-        "date": format_datetime_for_json(item_created)
-        })
-    #temporalExtent: begin is the datatime, hard coded 'Present'as end   
-    update_dict(properties_dict['temporalExtent'], {
-    "begin": format_datetime_for_json(item_start_date),
-    "end": format_datetime_for_json(item_end_date)})
-    
-    #options  
-    links_list = links_to_properties_options(links_list=item_links, id=item_id, root_name=root_name, title_en=title_en, title_fr=title_fr, stac_type='item')
-    assets_list = assets_to_properties_options(assets_list=item_assets) if item_assets else []
-    options_list = links_list+assets_list
-    options_list = [i for n, i in enumerate(options_list) if i not in options_list[n + 1:]] # delete duplicates
-        
-    # The shared attributes between Items and Collections  
-    description_en_str = f"{description_en or ''} {disclaimer_en}"
-    description_fr_str = f"{description_fr or ''} {disclaimer_fr}"
-    keywords_en_str = f"SpatioTemporal Asset Catalog, stac, {keywords_en or ''}"
-    keywords_fr_str = f"SpatioTemporal Asset Catalog, stac, {keywords_fr or ''}"
-
-    #Geometry 
-    west, south, east, north = [round(coord, 2) for coord in item_bbox]
-    geometry_str = f"POLYGON(({west} {south}, {east} {south}, {east} {north}, {west} {north}, {west} {south}))"
-    
-    #EO filters / SAR properties 
-    orbit_state = item_properties.get('sat:orbit_state', 'None')
-    polarizations = item_properties.get('sar:polarizations', 'None') #list
-    polarizations_str = polarization_to_string(polarizations)
-    eoFilters = [ 
-        {
-			"polarizations":polarizations_str,
-			"orbitState": orbit_state
-		}
-    ]
-    
-    # Other properties 
-    update_dict(properties_dict, {
-        "topicCategory": topicCategory, 
-        "type": type_data, 
-        "spatialRepresentation":spatialRepresentation,
-        "status":status,
-        "maintenance":maintenance,
-        'useLimits': {'en': useLimits_en, 'fr': useLimits_fr},
-        'contact': contact,
-        'options': options_list, 
-        'description': {'en': description_en_str, 'fr': description_fr_str},
-        'keywords': {'en': keywords_en_str, 'fr': keywords_fr_str},
-        "geometry": geometry_str, 
-        'sourceSystemName': sourceSystemName, 
-        'eoCollection':eoCollection,
-        'eoFilters':eoFilters,   
-    })
-     
-    #skipped: date: None for STAC collection 
-    #skipped: refsys, refSys_version  
-    #skipped metadataStandard, metadataStandardVersion, metadataStandardVersion, graphicOverview, distributionFormat_name, distributionFormat_format
-    #skipped: accessConstraints, otherConstraints, dateStamp, dataSetURI, locale,language
-    #skipped: characterSet, environmentDescription,supplementalInformation
-    #skipped: credits, cited, distributor,sourceSystemName
-    # options 
-    return (properties_dict)
-
-
-def get_item_fields(item_dict): 
-    """Get the collection fields needed for the geocore mapping 
-    :param item_dict: dictionary of a singel STAC item  
-    """
-    item_id = item_dict.get('id')
-    item_bbox = item_dict.get('bbox')
-    item_links = item_dict.get('links')
-    item_assets = item_dict.get('assets')
-    item_properties = item_dict.get('properties')
-    coll_id = item_dict.get('collection')
-    return item_id, item_bbox, item_links, item_assets, item_properties, coll_id; 
 
 def polarization_to_string(polarization):
     # Check if the polarization is None
@@ -543,13 +408,10 @@ def format_datetime_for_json(date_input, default_date=datetime(1900, 1, 1)):
     # If date_input is a string, parse it; if it's already a datetime, use it directly
     if isinstance(date_input, str):
         try:
-            date_obj = datetime.strptime(date_input, '%Y-%m-%dT%H:%M:%S.%f%z')
+            date_obj = parse_datetime(date_input, (ISO_FORMAT, ISO_SPACE_FORMAT))
         except ValueError:
-            try:
-                date_obj = datetime.strptime(date_input, '%Y-%m-%d %H:%M:%S.%f%z')
-            except ValueError:
-                print("The date format does not match the expected format. Using default date.")
-                date_obj = default_date
+            print("The date format does not match the expected format. Using default date.")
+            date_obj = default_date
     elif isinstance(date_input, datetime):
         date_obj = date_input
     else:
@@ -562,3 +424,39 @@ def format_datetime_for_json(date_input, default_date=datetime(1900, 1, 1)):
         formatted_date = date_obj.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
 
     return formatted_date
+
+
+def item_created_date(item_created):
+    """Publication and creation dates of an item, None if it has no created date"""
+    return format_datetime_for_json(item_created) if item_created is not None else None
+
+
+# Declarative mapping of the STAC items of the collection to GeoCore, see geocore_mapping.ItemMapping 
+ITEM_MAPPING_SPEC = {
+    # StacItem field: (path in the STAC item, default) 
+    'fields': {
+        'id': (('id',), None), 
+        'collection': (('collection',), None), 
+        'bbox': (('bbox',), None), 
+        'links': (('links',), None), 
+        'assets': (('assets',), None), 
+        'title': (('properties', 'title'), required_field), 
+        'datetime': (('properties', 'datetime'), required_field), 
+        'end_datetime': (('properties', 'end_datetime'), required_field), 
+        'created': (('properties', 'created'), None), 
+        'polarizations': (('properties', 'sar:polarizations'), 'None'), #list
+        'orbit_state': (('properties', 'sat:orbit_state'), 'None'), 
+    },
+    #temporalExtent: begin is the datatime, end is the end_datetime 
+    'temporalExtent': {'begin': Field('datetime', item_begin_date), 'end': Field('end_datetime', item_end_date)},
+    'date': {
+        'published': {"text": 'publication; publication', "date": Field('created', item_created_date)},
+        'created': {"text": 'creation; création', "date": Field('created', item_created_date)},
+    },
+    'date_field': 'created',
+    #EO filters / SAR properties 
+    'eoFilters': [{"polarizations": Field('polarizations', polarization_to_string), "orbitState": Field('orbit_state')}],
+    'disclaimer': (disclaimer_en, disclaimer_fr),
+}
+item_mapping = ItemMapping(ITEM_MAPPING_SPEC)
+item_record = item_mapping.record #StacItem record of a STAC item (feature), built once per item while the page is decoded 
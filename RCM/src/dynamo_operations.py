@@ -1,15 +1,15 @@
 import boto3
+from aws_clients import get_resource
 from datetime import datetime
 from aws_lambda_powertools import Logger
 
 logger = Logger()
-dynamodb = boto3.resource('dynamodb')
 status_finished = "finished"
 region = 'ca-central-1'
 
 def create_item(table_name, item):
     logger.info({"action":"create_dynamo_item", "payload":{"table_name":table_name, "item":item}})
-    table = dynamodb.Table(table_name)
+    table = get_resource('dynamodb').Table(table_name)
     datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     item["created_at"] = datetime_now
     item["updated_at"] = datetime_now
@@ -21,7 +21,7 @@ def create_item(table_name, item):
 
 def update_item_finished(table_name, item):
     logger.info({"action":"update_dynamo_item", "payload":{"table_name":table_name, "item":item}})
-    table = dynamodb.Table(table_name)
+    table = get_resource('dynamodb').Table(table_name)
     datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
@@ -46,7 +46,7 @@ def update_item_finished(table_name, item):
 
 def update_finished_processes(table_name, scatter_gather_id, value_to_sum):
     logger.info({"action":"update_finished_processes", "payload":{"table_name":table_name, "scatter_gather_id":scatter_gather_id, "value":value_to_sum}})
-    table = dynamodb.Table(table_name)
+    table = get_resource('dynamodb').Table(table_name)
     datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
@@ -2,6 +2,14 @@ import os
 import time
 from aws_lambda_powertools import Logger
 from dynamo_operations import update_finished_processes, create_dynamodb_stream_eventsource
+from geoparquet_output import merge_parquet_parts, parquet_output
+from lastrun import reconcile_harvest
+
+geocore_template_bucket_name = os.getenv('GEOCORE_TEMPLATE_BUCKET_NAME') #bucket of the lastRun files written by the processor
+collection = os.getenv('COLLECTION') #collection of the lastRun files, e.g. sentinel-1
+processed_data_bucket_name = os.getenv('PROCESSED_DATA_BUCKET_NAME') #bucket of the items and GeoParquet part files written by the processor
+parquet_bucket_name = os.getenv('PARQUET_BUCKET_NAME') #bucket of the merged GeoParquet file
+parquet_filename = os.getenv('PARQUET_FILENAME') #merged GeoParquet file, e.g. sentinel1-geoparquet.parquet
 
 
 logger = Logger()
@@ -23,6 +31,7 @@ def lambda_handler(event, context):
     """
     
     finished_sg_ids = []
+    total_pages = 0
     for record in event["Records"]:
         event_name = record["eventName"]
         new_image = record["dynamodb"]['NewImage']
@@ -31,7 +40,18 @@ def lambda_handler(event, context):
         
         if finished_processes == total_processes:
             finished_sg_ids.append(new_image["scatter_gather_id"]['S'])
+            total_pages = int(total_processes)
 
     # report ScatterGather finished or trigger your next step
     for scatter_gather_id in finished_sg_ids:
         logger.info({"action":"finished_scatter_gather_id", "payload":{"scatter_gather_id":scatter_gather_id}})
+    
+    # Every page of the harvest logged its items, delete the items of the previous harvests that no page logged 
+    if finished_sg_ids:
+        current_items, stale, e = reconcile_harvest(geocore_template_bucket_name, processed_data_bucket_name, collection, total_pages)
+        logger.info({"action":"reconcile_harvest", "payload":{"current":len(current_items), "stale":stale, "error":e}})
+    
+    # Every page of the harvest logged its GeoParquet part files, concatenate them into the collection GeoParquet file 
+    if finished_sg_ids and parquet_output:
+        parts, rows = merge_parquet_parts(processed_data_bucket_name, parquet_bucket_name, parquet_filename, keys=current_items)
+        logger.info({"action":"merge_parquet_parts", "payload":{"parts":parts, "rows":rows, "parquet_filename":parquet_filename}})
@@ -0,0 +1,115 @@
+import os
+import logging
+import traceback
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+mapping_workers = int(os.getenv('MAPPING_WORKERS', '1')) #number of mapping processes, 1 maps in the handler process
+mapping_batch_size = int(os.getenv('MAPPING_BATCH_SIZE', '64')) #mapped items sent back to the handler per message
+
+end_of_shard = None
+
+
+def map_shard(conn, items, worker, workers, map_item, serialize, batch_size, map_batch=None):
+    """Worker process: map every workers-th item of the page, starting at worker, and send back serialized documents
+    Results are sent in batches of (name, body bytes); None marks an item map_item skipped, a string is a traceback.
+    With map_batch, the items of each batch are mapped with a single call (e.g. by a columnar engine).
+    """
+    if map_batch is None:
+        map_batch = lambda shard_items: [map_item(item) for item in shard_items]
+    try:
+        indices = range(worker, len(items), workers)
+        for first in range(0, len(indices), batch_size):
+            mapped_items = map_batch([items[index] for index in indices[first:first + batch_size]])
+            conn.send([(mapped[0], serialize(mapped[1])) if mapped is not None else None for mapped in mapped_items])
+        conn.send(end_of_shard)
+    except BaseException:
+        conn.send(traceback.format_exc())
+    finally:
+        conn.close()
+
+
+class MappingPool:
+    """Map the items of a page on several cores with worker processes
+
+    Item mapping is CPU-bound pure Python, so a single process uses one vCPU whatever the Lambda size.
+    The pool forks MAPPING_WORKERS processes after the page, the GeoCore template and the collection
+    dictionaries are loaded, so every worker inherits them once instead of receiving them by pickling.
+    Items are sharded round-robin (item i goes to worker i % workers) and each worker sends its mapped
+    documents back already serialized to bytes, so no large dictionary crosses a process boundary.
+
+    With map_batch, each worker maps the items of a message with a single call instead of calling map_item.
+
+    AWS Lambda has no /dev/shm, so multiprocessing.Pool and Queue are not available: the pool only uses
+    Process and Pipe, which are.
+
+    Usage:
+        pool = MappingPool(items, map_item=..., serialize=serialize_json)
+        for mapped in pool.results():  # in page order
+            if mapped is not None:
+                name, body = mapped
+    """
+
+    def __init__(self, items, map_item, serialize, workers=None, batch_size=None, map_batch=None):
+        self.workers = max(1, min(workers or mapping_workers, len(items) or 1))
+        self.batch_size = max(1, batch_size or mapping_batch_size)
+        self.processes = []
+        self.connections = []
+        context = multiprocessing.get_context('fork')
+        for worker in range(self.workers):
+            parent_conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(
+                target=map_shard,
+                args=(child_conn, items, worker, self.workers, map_item, serialize, self.batch_size, map_batch),
+                name=f'mapping-worker-{worker}',
+                daemon=True
+                )
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.connections.append(parent_conn)
+        self.total = len(items)
+
+    def results(self):
+        """Yield (name, body bytes) for every item, in page order, or None for an item map_item skipped
+        One value is yielded per item so the position in the page is known, e.g. to checkpoint it.
+        """
+        buffers = [deque() for _ in range(self.workers)]
+        finished = [False] * self.workers
+        try:
+            for index in range(self.total):
+                worker = index % self.workers
+                while not buffers[worker]:
+                    if finished[worker]:
+                        raise RuntimeError(f'Mapping worker {worker} stopped before item {index}')
+                    self.receive(buffers, finished)
+                yield buffers[worker].popleft()
+        finally:
+            self.close()
+
+    def receive(self, buffers, finished):
+        """Wait until at least one worker sent a batch and buffer it"""
+        waiting = [conn for worker, conn in enumerate(self.connections) if not finished[worker]]
+        for conn in wait(waiting):
+            worker = self.connections.index(conn)
+            try:
+                message = conn.recv()
+            except EOFError:
+                message = f'Mapping worker {worker} exited unexpectedly'
+            if isinstance(message, str):
+                raise RuntimeError(f'Mapping worker {worker} failed:\n{message}')
+            if message is end_of_shard:
+                finished[worker] = True
+            else:
+                buffers[worker].extend(message)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                logging.error(f'Terminating {process.name}')
+                process.terminate()
+        self.connections, self.processes = [], []
@@ -0,0 +1,71 @@
+import os
+import gzip
+
+from s3_operations import serialize_compact
+
+output_block_size = int(os.getenv('OUTPUT_BLOCK_SIZE', '64')) #documents per gzip member of a page file (OUTPUT_FORMAT 'ndjson'), the unit of a ranged read
+
+
+class NdjsonPageWriter:
+    """Write the GeoCore documents of a page as one gzip-compressed newline-delimited JSON file and its offset index
+
+    Every document is one compact JSON line, in the order the documents are added. The lines are compressed by
+    blocks of block_size documents, each block being a complete gzip member: the members concatenated are a
+    regular .gz file that any gzip reader decompresses in one pass, and a single document can be read with a
+    ranged GET of its block. Blocks are compressed as soon as they are full, so only the compressed page is
+    held in memory.
+
+    The index is a small JSON document:
+        {"file": key of the page file, "count": number of documents,
+         "blocks": [[compressed offset, compressed length, first line], ...],
+         "items": {per-item file name: line}}
+    The per-item file name is the key the document has in the per-item output (OUTPUT_FORMAT 'geojson'). An item
+    added twice has two lines, the index points to the last one, like the per-item key the last upload overwrites.
+
+    Usage:
+        page_file = NdjsonPageWriter('eodms-sentinel-1-page-3-0')
+        for item_name, geocore_dict in documents:
+            page_file.add((item_name, geocore_dict))
+        (data_name, data_body), (index_name, index_body) = page_file.close()
+    """
+
+    def __init__(self, name, block_size=None):
+        self.key = name + '.ndjson.gz'
+        self.index_key = name + '.index.json'
+        self.block_size = max(1, block_size or output_block_size)
+        self.lines = [] #serialized documents of the current block
+        self.members = [] #compressed blocks
+        self.blocks = [] #[offset, length, first line] of the compressed blocks
+        self.size = 0 #compressed size of the blocks written so far
+        self.items = {}
+        self.count = 0
+
+    def add(self, mapped):
+        """Append a mapped document
+        :param mapped: tuple of the per-item file name and the GeoCore dictionary, or its compact JSON bytes
+        """
+        item_name, json_data = mapped
+        body = json_data if isinstance(json_data, (bytes, bytearray)) else serialize_compact(json_data)
+        self.lines.append(body)
+        self.items[item_name] = self.count
+        self.count += 1
+        if len(self.lines) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Compress the documents of the current block into a gzip member"""
+        if not self.lines:
+            return
+        member = gzip.compress(b'\n'.join(self.lines) + b'\n', compresslevel=6, mtime=0)
+        self.blocks.append([self.size, len(member), self.count - len(self.lines)])
+        self.members.append(member)
+        self.size += len(member)
+        self.lines = []
+
+    def close(self):
+        """Compress the last block and return the page file and its index
+        :return: tuple of (key, gzip bytes) of the page file and (key, JSON bytes) of the index
+        """
+        self.flush()
+        index = {"file": self.key, "count": self.count, "blocks": self.blocks, "items": self.items}
+        return (self.key, b''.join(self.members)), (self.index_key, serialize_compact(index))
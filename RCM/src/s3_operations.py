@@ -2,42 +2,83 @@ import boto3
 import logging
 import os 
 import json
+import gzip
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from aws_clients import get_client, get_resource
+
+# Optional faster encoders, used when they are installed 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+delete_batch_size = 1000 #maximum number of keys of a DeleteObjects request
+delete_concurrency = int(os.getenv('DELETE_CONCURRENCY', '4')) #DeleteObjects requests in flight
 
 def delete_filelist_s3(deleted_filelist, bucket):
     """ Delete the STAC JSON files in deleted_filelist from an s3 bucket
     Return a message to the user: "Deleted xx records from S3 yy bucket"
     :parm deleted_filelist: a list of s3 files to be deleted 
     :parm bucket: s3 bucket to delete from 
+    :return: error message listing the files that could not be deleted, None if all of them were deleted 
     """
-    s3 = boto3.resource('s3')
-    error_msg = None 
-    count = 0
-    for filename in deleted_filelist:    
-        try: 
-            s3object = s3.Object(bucket, filename)
-            response = s3object.delete()
-            count += 1
-            #print("Response: ", response)
-            #print(f"Deleted filenames: {filename} from bucket {bucket}")
-        except ClientError as e: 
+    result = delete_objects_s3(deleted_filelist, bucket)
+    print('Deleted ', result["deleted"], " records from S3 ", bucket)
+    if not result["errors"]:
+        return None
+    return ''.join(f'Failed to delete {error["Key"]} from bucket {bucket}: {error["Code"]} {error["Message"]}\n' for error in result["errors"])
+
+
+def delete_objects_s3(keys, bucket, s3_client=None):
+    """ Delete keys from an s3 bucket with DeleteObjects, up to 1000 keys per request 
+    The batches are sent concurrently (DELETE_CONCURRENCY), so deleting the 5000 files of a lastRun takes 5 requests. 
+    :parm keys: list of s3 keys to be deleted 
+    :parm bucket: s3 bucket to delete from 
+    :param s3_client: boto3 S3 client to reuse. If not specified the shared client of aws_clients is used
+    :return: dictionary {"deleted": number of deleted keys, "errors": [{"Key", "Code", "Message"}]} 
+    """
+    if s3_client is None:
+        s3_client = get_client('s3')
+    batches = [keys[i:i + delete_batch_size] for i in range(0, len(keys), delete_batch_size)]
+    
+    def delete_batch(batch):
+        try:
+            response = s3_client.delete_objects(
+                Bucket=bucket, 
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+        except ClientError as e:
             logging.error(e)
-            error_msg += e
-    print('Deleted ', count, " records from S3 ", bucket)
-        
-    return error_msg
+            error = e.response.get('Error', {})
+            return [{"Key": key, "Code": error.get('Code', 'ClientError'), "Message": error.get('Message', str(e))} for key in batch]
+        errors = response.get('Errors', [])
+        for error in errors:
+            logging.error(f'Failed to delete {error.get("Key")} from bucket {bucket}: {error.get("Code")} {error.get("Message")}')
+        return [{"Key": error.get('Key'), "Code": error.get('Code'), "Message": error.get('Message')} for error in errors]
+    
+    if len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(delete_concurrency, len(batches))) as executor:
+            batch_errors = list(executor.map(delete_batch, batches))
+    else:
+        batch_errors = [delete_batch(batch) for batch in batches]
+    errors = [error for errors in batch_errors for error in errors]
+    return {"deleted": len(keys) - len(errors), "errors": errors}
 
 # Requires open_s3_file(bucket, filename),  s3_list_filenames(bucket), delete_files_s3(filename_list, bucket)
 def delete_stac_s3(bucket_geojson, bucket_template, filename):
     error_msg = None 
-    filenames_list = list_filenames_s3(bucket_template)    
-    if filename in filenames_list: 
+    # Keyed existence check, the cost does not depend on the number of objects in the template bucket 
+    if head_file_s3(bucket_template, filename): 
         lastRun = open_file_s3(bucket_template, filename)
         #ccmeo_napl-ottawa_napl-ottawa-2001.geojson, or lastRun.replace('\r\n', ' ').split(' ')
-        lastRun_list = lastRun.splitlines()
-        e = delete_filelist_s3(deleted_filelist=lastRun_list, bucket=bucket_geojson)
-        if e != None: 
-            error_msg += e
+        # lastRun lines may carry the content hash of the item after a tab 
+        lastRun_list = [line.split('\t')[0] for line in lastRun.splitlines() if line]
+        error_msg = delete_filelist_s3(deleted_filelist=lastRun_list, bucket=bucket_geojson)
     else: 
         print(f"No existing {filename} in the bucket {bucket_template}")
     return error_msg
@@ -60,7 +101,7 @@ def open_file_s3(bucket, filename):
         #print(type(file_body))
         """
         # Second option to load file from S3 buckets 
-        s3 = boto3.resource('s3')
+        s3 = get_resource('s3')
         content_object = s3.Object(bucket, filename)
         file_body= content_object.get()['Body'].read().decode('utf-8')
         #json_content = json.loads(file_content)
@@ -69,45 +110,153 @@ def open_file_s3(bucket, filename):
     except ClientError as e:
         logging.error(e)
         return False 
+
+
+def open_file_s3_if_modified(bucket, filename, etag=None):
+    """Open a S3 file only if it changed since the ETag we already hold (conditional GET)
+    :param bucket: Bucket name
+    :param filename: Specific file name to open
+    :param etag: ETag of the copy held by the caller, None to always download
+    :return: (body of the file as a string, ETag), (None, etag) if the object is unchanged, or (False, None) on error
+    """
+    s3_client = get_client('s3')
+    try:
+        if etag:
+            response = s3_client.get_object(Bucket=bucket, Key=filename, IfNoneMatch=etag)
+        else:
+            response = s3_client.get_object(Bucket=bucket, Key=filename)
+        file_body = response['Body'].read().decode('utf-8')
+        return str(file_body), response.get('ETag')
+    except ClientError as e:
+        # S3 answers a matching If-None-Match with 304 Not Modified, surfaced by botocore as a ClientError
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return None, etag
+        logging.error(e)
+        return False, None
     
     
-def list_filenames_s3(bucket):
+def head_file_s3(bucket, filename, s3_client=None):
+    """Look a S3 file up by key with a HEAD request, without downloading it 
+    :param bucket: Bucket name
+    :param filename: Specific file name to look up
+    :param s3_client: boto3 S3 client to reuse. If not specified the shared client of aws_clients is used
+    :return: metadata of the file (ContentLength, ETag, LastModified, Metadata), None if it does not exist, False on error
+    """
+    if s3_client is None:
+        s3_client = get_client('s3')
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=filename)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        logging.error(e)
+        return False
+
+
+def list_filenames_s3(bucket, prefix=''):
     """ List a S3 bucket to obtain file names 
-    Note: if there are too many records (>999) to pricessm we may need to paginate 
+    The listing is paginated (1000 keys per request) and can be scoped to a prefix, e.g. 'lastRun_eodms_sentinel-1_', 
+    so only the matching keys are listed instead of the whole bucket. 
     :parm bucket: name of the bucket 
+    :parm prefix: only list the file names starting with prefix 
     :return a list of filenames within the bucket 
     """
-    s3 = boto3.resource("s3")
-    my_bucket = s3.Bucket(bucket)
+    s3_client = get_client('s3')
+    paginator = s3_client.get_paginator('list_objects_v2')
     filename_list = []
-    count = 0 
-    for my_bucket_object in my_bucket.objects.all():
-        #print(my_bucket_object.key)
-        filename_list.append(my_bucket_object.key)
-        count += 1 
-    print(f"{count} files are included in the bucket {bucket}")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        filename_list.extend(my_bucket_object['Key'] for my_bucket_object in page.get('Contents', []))
+    print(f"{len(filename_list)} files are included in the bucket {bucket} with prefix '{prefix}'")
     return filename_list
 
 
+# Serialize a GeoCore/JSON document to the bytes uploaded to S3 
+def serialize_compact(json_data):
+    """Compact UTF-8 JSON, with orjson when it is installed (it writes UTF-8 bytes directly, without an intermediate str)
+    Both encoders give the same bytes except for some floats: orjson writes exponents without sign or leading zeros 
+    (1e16 and 1e-7, json writes 1e+16 and 1e-07), and NaN and Infinity as null. When orjson is added to or removed from 
+    the runtime, the content hashes of the documents with such values change, so SKIP_UNCHANGED uploads them once again. 
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(json_data)
+        except TypeError:
+            pass #e.g. integers beyond 64 bits, not supported by orjson
+    return json.dumps(json_data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def serialize_pretty(json_data):
+    """Indented UTF-8 JSON, the original format of the uploads, for debugging"""
+    return json.dumps(json_data, indent=4, ensure_ascii=False).encode('utf-8')
+
+
+json_serializers = {
+    'compact': serialize_compact,
+    'pretty': serialize_pretty
+    }
+json_serializer = os.getenv('JSON_SERIALIZER', 'compact') #'compact', or 'pretty' to upload indented JSON for debugging
+
+
+def serialize_json(json_data):
+    """Serialize json_data to UTF-8 JSON bytes, the body format of upload_file_s3, with the JSON_SERIALIZER format 
+    :param json_data: JSON serializable data 
+    :return: bytes
+    """
+    return json_serializers[json_serializer](json_data)
+
+
+# Optional Content-Encoding of the uploaded bodies 
+content_encoders = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+    }
+if zstandard is not None:
+    content_encoders['zstd'] = lambda body: zstandard.ZstdCompressor().compress(body)
+
+
+def encode_body(body, content_encoding=None):
+    """Compress a serialized body for a S3 upload with Content-Encoding 
+    :param body: bytes 
+    :param content_encoding: None, 'gzip' or 'zstd' (only when the zstandard package is installed) 
+    :return: the encoded bytes 
+    """
+    if not content_encoding:
+        return body
+    if content_encoding not in content_encoders:
+        raise ValueError(f'Unsupported Content-Encoding {content_encoding}, available: {sorted(content_encoders)}')
+    return content_encoders[content_encoding](body)
+
+
 # Upload a a text or json file to S3 
-def upload_file_s3(filename, bucket, json_data, object_name=None):
+def upload_file_s3(filename, bucket, json_data, object_name=None, s3_client=None, content_encoding=None):
     """Upload a file to an S3 bucket
     :param file_name: File to upload
     :param bucket: Bucket to upload to
-    :param json_data: json_data to be updated, can be none 
+    :param json_data: json_data to be updated, or bytes already serialized with serialize_json(), can be none 
     :param object_name: S3 object name. If not specified then file_name is used
+    :param s3_client: boto3 S3 client to reuse, e.g. shared by concurrent uploads. If not specified the shared client of aws_clients is used
+    :param content_encoding: compress json_data and upload it with this Content-Encoding, see encode_body() 
     :return: True if file was uploaded, else False
     """
     # If S3 object_name was not specified, use file_name
     if object_name is None:
         object_name = os.path.basename(filename)
     # boto3.client vs boto3.resources:https://www.learnaws.org/2021/02/24/boto3-resource-client/ 
-    s3_client = boto3.client('s3')  
+    if s3_client is None:
+        s3_client = get_client('s3')  
     if json_data: 
         try:
-            response = s3_client.put_object(Body=(bytes(json.dumps(json_data, indent=4, ensure_ascii=False).encode('utf-8'))), 
-                                            Bucket=bucket,
-                                            Key = filename)
+            # The serialized bytes are uploaded as they are, without any intermediate copy 
+            body = json_data if isinstance(json_data, (bytes, bytearray)) else serialize_json(json_data)
+            if content_encoding:
+                response = s3_client.put_object(Body=encode_body(body, content_encoding), 
+                                                Bucket=bucket,
+                                                Key = filename,
+                                                ContentType='application/json',
+                                                ContentEncoding=content_encoding)
+            else:
+                response = s3_client.put_object(Body=body, 
+                                                Bucket=bucket,
+                                                Key = filename)
         except ClientError as e:
             logging.error(e)
             return False    
@@ -0,0 +1,29 @@
+class StacItem:
+    """Compact record of a STAC item (feature), holding only the fields the GeoCore mapping reads
+
+    A decoded feature is a nested dictionary of every member of the item, most of them (e.g. the other
+    properties) never read by the mapping. The record is built once per item while the page is decoded
+    (see item_record() of the stac_to_geocore module), so the feature dictionary can be dropped at once
+    and the items waiting in the pipeline (or held by the mapping pool) only keep these fields.
+
+    The properties are stored with the defaults of the mapping: created is None when the item has none,
+    polarizations and orbit_state are the string 'None' when the item does not have them.
+    """
+
+    __slots__ = ('id', 'collection', 'bbox', 'links', 'assets', 'title', 'datetime', 'end_datetime', 'created', 'polarizations', 'orbit_state')
+
+    def __init__(self, id, collection, bbox, links, assets, title, datetime, end_datetime=None, created=None, polarizations='None', orbit_state='None'):
+        self.id = id
+        self.collection = collection
+        self.bbox = bbox
+        self.links = links
+        self.assets = assets
+        self.title = title
+        self.datetime = datetime
+        self.end_datetime = end_datetime
+        self.created = created
+        self.polarizations = polarizations
+        self.orbit_state = orbit_state
+
+    def __repr__(self):
+        return f'StacItem(id={self.id!r}, collection={self.collection!r})'
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import codecs
+
+stream_chunk_size = int(os.getenv('STREAM_CHUNK_SIZE', '65536')) #bytes read from the response stream at a time
+
+whitespace = re.compile(r'[ \t\n\r]*')
+structural = re.compile(r'["\[\]{}]') #characters that matter when skipping a value, outside of strings
+string_special = re.compile(r'["\\]') #characters that matter when skipping a value, inside a string
+number_tail = re.compile(r'[0-9.eE+-]*') #what may follow a number cut at the end of the buffer, e.g. "1." of "1.5"
+
+
+class JsonStream:
+    """Incremental (ijson-style) reader of a JSON document arriving as chunks of bytes
+
+    A STAC item page holds up to 5000 features. Instead of decoding the whole response with r.json(),
+    the reader walks the top-level object and decodes one value at a time, so features can be handed
+    to the mapping as soon as their bytes arrived and members we are not interested in (e.g. features
+    in the paginator) are skipped without building any Python object.
+    Only the part of the document not consumed yet is kept in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk to the buffer, dropping the consumed text
+        :return: False at the end of the stream
+        """
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(b'', final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def error(self, msg):
+        return json.JSONDecodeError(msg, self.buffer, self.pos)
+
+    def peek(self):
+        """Skip whitespace and return the next character, '' at the end of the stream"""
+        while True:
+            self.pos = whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars, and return it"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise self.error(f'Expecting one of {chars!r}')
+        self.pos += 1
+        return char
+
+    def decode_value(self):
+        """Decode and return the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A number running to the end of the buffer may continue in the next chunk
+                if self.eof or not number_tail.fullmatch(self.buffer, end):
+                    self.pos = end
+                    return value
+                failed = None
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise
+                failed = e
+            if not self.fill() and failed:
+                raise failed
+
+    def skip_value(self):
+        """Consume the next JSON value without decoding it"""
+        if self.peek() not in ('[', '{'):
+            self.decode_value()
+            return
+        depth, in_string = 0, False
+        while True:
+            if in_string:
+                match = string_special.search(self.buffer, self.pos)
+                if match and match.group() == '\\' and match.end() == len(self.buffer):
+                    # the escaped character is in the next chunk
+                    self.pos, match = match.start(), None
+                elif match:
+                    self.pos = match.end() + (1 if match.group() == '\\' else 0)
+                    in_string = match.group() == '\\'
+                    continue
+            else:
+                match = structural.search(self.buffer, self.pos)
+                if match:
+                    self.pos = match.end()
+                    char = match.group()
+                    if char == '"':
+                        in_string = True
+                    elif char in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return
+                    continue
+                self.pos = len(self.buffer)
+            if not self.fill():
+                raise self.error('Unexpected end of JSON stream')
+
+    def members(self):
+        """Iterate over the keys of an object, the caller must consume each member value before the next key"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self, start=0):
+        """Iterate over the decoded elements of an array
+        :param start: number of leading elements to skip without decoding them
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            if index < start:
+                self.skip_value()
+            else:
+                yield self.decode_value()
+            index += 1
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_json_array(chunks, key, start=0):
+    """Yield the elements of the array member key of a top-level JSON object, one at a time
+    :param chunks: iterable of bytes, e.g. response.iter_content()
+    :param key: name of the array member, e.g. 'features'
+    :param start: index of the first element to yield, the previous ones are skipped without decoding them
+    """
+    stream = JsonStream(chunks)
+    for name in stream.members():
+        if name == key:
+            yield from stream.elements(start)
+            return
+        stream.skip_value()
+
+
+def read_json_fields(chunks, keys):
+    """Decode only some members of a top-level JSON object, skipping the others without decoding them
+    :param chunks: iterable of bytes, e.g. response.iter_content()
+    :param keys: names of the members to decode, reading stops as soon as all of them were found
+    :return: dictionary of the members found
+    """
+    stream = JsonStream(chunks)
+    found = {}
+    for name in stream.members():
+        if name in keys:
+            found[name] = stream.decode_value()
+            if len(found) == len(keys):
+                break
+        else:
+            stream.skip_value()
+    return found
+
+
+def iter_response_features(response, start=0):
+    """Yield the features of a STAC item page response requested with stream=True, from the feature index start"""
+    return iter_json_array(response.iter_content(chunk_size=stream_chunk_size), 'features', start)
+
+
+def read_response_fields(response, keys):
+    """Decode only the members keys (e.g. context and links) of a STAC response requested with stream=True"""
+    return read_json_fields(response.iter_content(chunk_size=stream_chunk_size), keys)
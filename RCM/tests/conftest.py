@@ -0,0 +1,17 @@
+import os
+import sys
+
+# The Lambda modules are flat files of src/, imported the way the Lambda runtime does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Environment of the processor function, see geocore-eo-sentinel1-harvester.yml. Nothing is sent to AWS or to the
+# STAC API, the tests replace the S3 and HTTP calls of the functions they run.
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ca-central-1')
+os.environ.setdefault('GEOCORE_TEMPLATE_BUCKET_NAME', 'geocore-template')
+os.environ.setdefault('GEOCORE_TEMPLATE_NAME', 'geocore-format-null-template.json')
+os.environ.setdefault('PROCESSED_DATA_BUCKET_NAME', 'processed-data')
+os.environ.setdefault('API_ROOT', 'https://api.test/stac')
+os.environ.setdefault('ROOT_NAME', 'EODMS Datacube API / EODMS Cube de données API')
+os.environ.setdefault('SOURCE', 'eodms')
+os.environ.setdefault('SOURCESYSTEMNAME', 'ccmeo-eodms')
+os.environ.setdefault('COLLECTION', 'rcm')
@@ -0,0 +1,84 @@
+"""GeoCore documents of the processor against the baseline translation
+
+data/geocore_baseline.jsonl holds the documents written by the translation functions of the first release
+(item_to_features_properties, root_to_features_properties, coll_to_features_properties on a deep copy of the
+template) for the STAC items, root and collections of data/stac_fixture.json, one compact JSON document per line:
+the items in page order, then the root and the collection documents. The fixture items cover the odd cases of the
+translation (repeated and rounded bboxes, datetime formats, missing polarizations and orbit states, no assets).
+"""
+import json
+import os
+
+import pytest
+
+import processor
+import stac_to_geocore_rcm as stac_to_geocore
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+@pytest.fixture(scope='module')
+def stac_fixture():
+    with open(os.path.join(DATA, 'stac_fixture.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    with open(os.path.join(DATA, 'geocore_baseline.jsonl'), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def page_mapping(stac_fixture, monkeypatch):
+    """Root parameters, collection dictionary and item mapping of a page, as process_page binds them"""
+    collections = stac_fixture['collections']['collections']
+    template = stac_to_geocore.compile_geocore_template(stac_fixture['geocore_template']['features'][0])
+    monkeypatch.setattr(processor, 'get_stac_root', lambda api_root, ttl=None: stac_fixture['root'])
+    monkeypatch.setattr(processor, 'get_stac_collections', lambda api_root, ttl=None: collections)
+    monkeypatch.setattr(stac_to_geocore, 'get_stac_collections', lambda api_root, ttl=None: collections)
+    monkeypatch.setattr(processor, 'get_geocore_template', lambda bucket, name: template())
+    params = processor.get_root_params()
+    coll_id_dict = stac_to_geocore.create_coll_dict(processor.api_root, processor.collection, stac_to_geocore.coll_description_en, stac_to_geocore.coll_description_fr, stac_to_geocore.coll_keywords_fr)
+    return params, coll_id_dict, template, processor.bind_item_mapping(params, coll_id_dict)
+
+
+def item_records(stac_fixture):
+    return [stac_to_geocore.item_record(feature) for feature in stac_fixture['items']['features']]
+
+
+def test_items_match_baseline(stac_fixture, baseline, page_mapping):
+    _, _, _, map_items = page_mapping
+    mapped = [processor.map_stac_item(item, map_items) for item in item_records(stac_fixture)]
+    assert [item_name for item_name, _ in mapped] == [
+        f"eodms-{feature['collection']}-{feature['id']}.geojson" for feature in stac_fixture['items']['features']
+        ]
+    assert [geocore_dict for _, geocore_dict in mapped] == baseline[:-2]
+
+
+def test_columnar_batch_matches_baseline(stac_fixture, baseline, page_mapping):
+    _, _, _, map_items = page_mapping
+    mapped = processor.map_stac_items(item_records(stac_fixture), map_items)
+    assert [geocore_dict for _, geocore_dict in mapped] == baseline[:-2]
+
+
+def test_serialized_items_match_baseline(stac_fixture, baseline, page_mapping):
+    _, _, _, map_items = page_mapping
+    mapped = processor.map_stac_items(item_records(stac_fixture), map_items)
+    assert [json.loads(processor.serialize_json(geocore_dict)) for _, geocore_dict in mapped] == baseline[:-2]
+
+
+def test_root_and_collection_match_baseline(stac_fixture, baseline, page_mapping):
+    params, _, template, _ = page_mapping
+    root_dict = template()
+    root_geocore = stac_to_geocore.update_geocore_dict(
+        root_dict, stac_to_geocore.root_to_features_properties(params, root_dict),
+        stac_to_geocore.to_features_geometry(root_dict, bbox=params['root_bbox'])
+        )
+    coll_data = stac_fixture['collections']['collections'][1]
+    coll_dict = template()
+    coll_geocore = stac_to_geocore.update_geocore_dict(
+        coll_dict, stac_to_geocore.coll_to_features_properties(params, coll_data, coll_dict),
+        stac_to_geocore.to_features_geometry(coll_dict, bbox=coll_data['extent']['spatial']['bbox'])
+        )
+    assert [root_geocore, coll_geocore] == baseline[-2:]
@@ -0,0 +1,63 @@
+import os
+import time
+import logging
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Process-wide registry of boto3 clients and resources shared by all lambdas.
+# Creating a client resolves credentials, loads the service model and opens a new connection pool, which costs
+# tens of milliseconds; the registry pays it once per container instead of once per call.
+# One connection per upload thread of every page processed at the same time (UPLOAD_CONCURRENCY x PAGE_CONCURRENCY)
+default_pool_connections = int(os.getenv('UPLOAD_CONCURRENCY', '16')) * int(os.getenv('PAGE_CONCURRENCY', '1'))
+aws_max_pool_connections = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', default_pool_connections)) #HTTP connections per client
+aws_retry_mode = os.getenv('AWS_RETRY_MODE', 'adaptive') #'adaptive' also rate limits the client when S3 throttles (503 Slow Down)
+aws_max_attempts = int(os.getenv('AWS_MAX_ATTEMPTS', '10'))
+
+client_config = Config(
+    max_pool_connections=aws_max_pool_connections,
+    retries={'mode': aws_retry_mode, 'max_attempts': aws_max_attempts}
+    )
+
+clients = {} #service name -> client
+resources = {} #service name -> resource
+registry_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """Return the shared boto3 client of a service, created on first use
+    Clients are thread safe, the same client (and connection pool) is used by every thread of the container.
+    :param service_name: e.g. 's3', 'sqs'
+    """
+    return get_or_create(clients, 'client', service_name, boto3.client)
+
+
+def get_resource(service_name):
+    """Return the shared boto3 resource of a service, created on first use
+    Requests go through the thread safe resource.meta.client; sub-resources (Table, Object) hold state, so
+    callers create them per call, e.g. get_resource('dynamodb').Table(name), instead of sharing them across threads.
+    :param service_name: e.g. 'dynamodb', 's3'
+    """
+    return get_or_create(resources, 'resource', service_name, boto3.resource)
+
+
+def get_or_create(registry, kind, service_name, factory):
+    instance = registry.get(service_name)
+    if instance is None:
+        # Creating clients through the default session concurrently is not thread safe
+        with registry_lock:
+            instance = registry.get(service_name)
+            if instance is None:
+                started_at = time.perf_counter()
+                instance = factory(service_name, config=client_config)
+                registry[service_name] = instance
+                log_creation(kind, service_name, started_at)
+    return instance
+
+
+def log_creation(kind, service_name, started_at):
+    # Creation time of each client, to compare the startup cost with the per-call cost of the requests
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    logging.info(f'Created boto3 {service_name} {kind} in {elapsed_ms:.1f} ms (max_pool_connections={aws_max_pool_connections}, retry mode {aws_retry_mode})')
+    print(f'Created boto3 {service_name} {kind} in {elapsed_ms:.1f} ms')
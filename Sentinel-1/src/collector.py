@@ -12,6 +12,7 @@ logger = Logger()
 from paginator import *
 from s3_operations import *
 from stac_to_geocore_sentinel1 import *
+from stac_metadata_cache import get_stac_root, get_stac_collections, publish_stac_metadata_snapshot, stac_metadata_bucket_name
 
 
 
@@ -25,6 +26,7 @@ root_name = os.environ['ROOT_NAME']
 source = os.environ['SOURCE']
 sourceSystemName = os.environ['SOURCESYSTEMNAME']
 collection = os.environ['COLLECTION']
+page_limit = int(os.getenv('PAGE_LIMIT', '5000')) #items per item-api page, each page is processed by one processor invocation
 
 
 """
@@ -45,18 +47,18 @@ datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 @logger.inject_lambda_context
 def lambda_handler(event, context):
   
-    #Create the item links json, limit=5000
-    pages = search_pages_get_json(url=api_root + '/collections/' +collection+'/items?limit=5000', collection=collection)
+    #Create the item links json, limit=PAGE_LIMIT, a smaller page spreads the collection over more processor invocations
+    pages = search_pages_get_json(url=api_root + '/collections/' +collection+f'/items?limit={page_limit}', collection=collection)
     filename = collection+'-item-api.json'
     msg = upload_file_s3(filename, bucket=eo_datacube_api_bucketname, json_data=pages,object_name=None)
     if msg: 
         print(f'Sucessfully uploaded {filename} to bucket: {eo_datacube_api_bucketname}, the length of {filename} is {len(pages)}')   
         
     #Root and Collection Leevl harvesting 
-    response_root = requests.get(f'{api_root}/')
-    if response_root.status_code == 200:
+    # The collector refreshes the STAC metadata cache (ttl=0) and publishes it for the processors 
+    root_data_json = get_stac_root(api_root, ttl=0)
+    if root_data_json:
         try: 
-            root_data_json = response_root.json()
             root_id = root_data_json['id']
             if root_id.isspace()==False:
                 root_id=root_id.replace(' ', '-')
@@ -64,8 +66,7 @@ def lambda_handler(event, context):
             root_links = root_data_json['links']
             
             # GeoCore properties bounding box is a required for frontend, here we use the first collection
-            response_collection = requests.get(f'{api_root}/collections/')
-            collection_data_list = response_collection.json()['collections']
+            collection_data_list = get_stac_collections(api_root, ttl=0)
             root_bbox = collection_data_list[1]['extent']['spatial']['bbox']
 
             # Perpare for parametes required for the function 
@@ -121,12 +122,15 @@ def lambda_handler(event, context):
             if msg: 
                 print(f'Mapping Collection: {coll_id}. Finished and Uploaded the collection to bucket: {processed_data_bucket_name}')
 
-        except json.JSONDecodeError:
-            # Handle JSON decode error
-            print("response_root is not in JSON format. Raw response:", response_root.text)
+        except (KeyError, IndexError) as e:
+            # Handle incomplete root or collections metadata 
+            print(f"The root or collections metadata of {api_root} is missing a required field: {e}")
+        
+        if publish_stac_metadata_snapshot():
+            print(f'Published the STAC metadata snapshot to bucket: {stac_metadata_bucket_name}')
             
     else: 
-        print('Request failed:root_api is {api_root}.  Status code: {response.status_code}. Response: {response.text}')
+        print(f'Request failed: root_api {api_root} is not available')
         
 
 
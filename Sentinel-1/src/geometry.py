@@ -0,0 +1,102 @@
+import os
+import math
+import struct
+import logging
+
+# Optional vectorized bbox rounding, numpy is provided by the AWSSDKPandas layer
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+bbox_validation = os.getenv('BBOX_VALIDATION', 'off').lower() == 'warn' #'warn' logs NaN, inverted and antimeridian-crossing bboxes
+
+# Beyond this magnitude the scaled value may be off by more than the tie tolerance below, round() is used instead
+exact_rounding_limit = 1e6
+
+
+def bbox_polygons(bboxes, ndigits=2):
+    """Rounded GeoJSON polygons and WKT strings of a batch of bboxes, in one pass
+    Every coordinate is rounded once, like round(coord, ndigits), and formatted once.
+    :param bboxes: Nx4 float array (numpy) or list of bboxes [west, south, east, north]
+    :param ndigits: decimals kept
+    :return: tuple of two lists: the GeoJSON Polygon coordinates [[[west, south], [east, south], [east, north],
+        [west, north], [west, south]]] and the 'POLYGON((west south, ...))' WKT string of each bbox
+    """
+    if numpy is not None and isinstance(bboxes, numpy.ndarray):
+        rounded = round_array(bboxes, ndigits)
+    else:
+        rounded = [[round(coord, ndigits) for coord in bbox] for bbox in bboxes]
+    coordinates, wkts = [], []
+    for west, south, east, north in rounded:
+        coordinates.append([[[west, south], [east, south], [east, north], [west, north], [west, south]]])
+        w, s, e, n = str(west), str(south), str(east), str(north)
+        wkts.append(f"POLYGON(({w} {s}, {e} {s}, {e} {n}, {w} {n}, {w} {s}))")
+    return coordinates, wkts
+
+
+def bbox_polygon(bbox, ndigits=2):
+    """Rounded GeoJSON polygon coordinates and WKT string of one bbox, see bbox_polygons()"""
+    coordinates, wkts = bbox_polygons([bbox], ndigits)
+    return coordinates[0], wkts[0]
+
+
+def polygon_wkb(coordinates):
+    """Little-endian WKB of a polygon, e.g. of a geometry built by bbox_polygons()
+    :param coordinates: GeoJSON Polygon coordinates, a list of rings of [x, y] points
+    :return: bytes
+    """
+    parts = [struct.pack('<BII', 1, 3, len(coordinates))] #byte order, wkbPolygon, number of rings
+    for ring in coordinates:
+        parts.append(struct.pack(f'<I{2 * len(ring)}d', len(ring), *[coord for point in ring for coord in point[:2]]))
+    return b''.join(parts)
+
+
+def round_array(values, ndigits):
+    """Round a float array like round(value, ndigits) element-wise, returned as nested lists of floats
+    numpy.round scales, rounds and unscales, which is not always correctly rounded: values whose scaled
+    value is close to a rounding tie (or too large, or not finite) are rounded again with round().
+    """
+    scale = 10.0 ** ndigits
+    with numpy.errstate(all='ignore'):
+        scaled = values * scale
+        rounded = (numpy.rint(scaled) / scale).tolist()
+        ambiguous = ~(numpy.isfinite(scaled) & (numpy.abs(values) < exact_rounding_limit)
+                      & (numpy.abs(scaled - numpy.floor(scaled) - 0.5) > 1e-6))
+    for row, column in zip(*numpy.nonzero(ambiguous)):
+        rounded[row][column] = round(float(values[row, column]), ndigits)
+    return rounded
+
+
+def bbox_issues(bboxes):
+    """Validate a batch of bboxes [west, south, east, north]
+    :param bboxes: Nx4 float array (numpy) or list of bboxes of 4 numbers
+    :return: list with, for each bbox, None if it is valid or a description of the issue: a NaN or infinite
+        coordinate, south above north (inverted), or west greater than east (the bbox crosses the antimeridian)
+    """
+    if numpy is not None and isinstance(bboxes, numpy.ndarray):
+        with numpy.errstate(invalid='ignore'):
+            not_finite = (~numpy.isfinite(bboxes)).any(axis=1).tolist()
+            inverted = (bboxes[:, 1] > bboxes[:, 3]).tolist()
+            crossing = (bboxes[:, 0] > bboxes[:, 2]).tolist()
+    else:
+        not_finite = [not all(math.isfinite(coord) for coord in bbox) for bbox in bboxes]
+        inverted = [bbox[1] > bbox[3] for bbox in bboxes]
+        crossing = [bbox[0] > bbox[2] for bbox in bboxes]
+    return [
+        'NaN or infinite coordinate' if nan else 'south above north' if south_above else 'crosses the antimeridian' if west_above else None
+        for nan, south_above, west_above in zip(not_finite, inverted, crossing)
+        ]
+
+
+def warn_bbox_issues(ids, bboxes):
+    """Log the invalid bboxes of a batch of items when BBOX_VALIDATION is 'warn', the geometries are kept as they are
+    :param ids: item ids, aligned with bboxes
+    :param bboxes: Nx4 float array (numpy) or list of bboxes of 4 numbers
+    """
+    if not bbox_validation:
+        return
+    for item_id, issue in zip(ids, bbox_issues(bboxes)):
+        if issue:
+            logging.warning(f'Invalid bbox of item {item_id}: {issue}')
+            print(f'Invalid bbox of item {item_id}: {issue}')
@@ -0,0 +1,65 @@
+import os
+
+# Optional bbox array (see geometry.bbox_polygons), numpy is provided by the AWSSDKPandas layer
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+numpy_min_rows = 16 #below this batch size the bboxes are rounded faster with round() than with an array
+columnar_batch_size = int(os.getenv('COLUMNAR_BATCH_SIZE', '64')) #items mapped at a time by the columnar engine (MAPPING_ENGINE 'columnar'), larger batches keep more objects alive for the garbage collector
+
+
+class ItemColumns:
+    """Columnar view of a batch of STAC items (StacItem records), for the batch item mapping
+
+    The fields the mapping needs are loaded into columns, one list per field, so GeoCore fields can be computed
+    in passes over whole columns, and values repeated across the page (datetimes, collections, polarizations)
+    are formatted once. When numpy is installed, the batch has at least numpy_min_rows items and
+    every bbox is a list of 4 floats, the bboxes are loaded into an Nx4 float array; otherwise they are kept as
+    the list of the item bboxes.
+
+    Usage:
+        columns = ItemColumns(items)
+        coordinates, wkts = bbox_polygons(columns.bboxes)
+    """
+
+    def __init__(self, items):
+        self.rows = items
+        bboxes = self.column('bbox')
+        if numpy is not None and len(bboxes) >= numpy_min_rows and all(is_float_bbox(bbox) for bbox in bboxes):
+            bboxes = numpy.array(bboxes, dtype=numpy.float64).reshape(len(bboxes), 4)
+        self.bboxes = bboxes
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, field):
+        """Column of the StacItem field, e.g. 'datetime' or 'polarizations'"""
+        return [getattr(item, field) for item in self.rows]
+
+
+def is_float_bbox(bbox):
+    return type(bbox) is list and len(bbox) == 4 and all(type(coord) is float for coord in bbox)
+
+
+def map_distinct(func, values):
+    """Apply func once per distinct value of a column, e.g. to format the datetimes of a page
+    Strings, None and lists of strings are looked up in a cache; other values (e.g. numbers, which compare
+    equal across types, or dictionaries) are passed to func every time.
+    :return: list of func(value) for every value
+    """
+    results = {}
+    mapped = []
+    for value in values:
+        if type(value) is str or value is None:
+            key = value
+        elif type(value) is list and all(type(element) is str for element in value):
+            key = tuple(value)
+        else:
+            mapped.append(func(value))
+            continue
+        if key not in results:
+            results[key] = func(value)
+        mapped.append(results[key])
+    return mapped
@@ -0,0 +1,64 @@
+import re
+import logging
+
+from s3_operations import list_filenames_s3, open_file_s3, delete_filelist_s3
+
+
+def format_lastrun_line(item_name, content_hash=None):
+    """lastRun lines are the item file name, followed by a tab and the MD5 of its content when it is known"""
+    return f"{item_name}\t{content_hash}\n" if content_hash else f"{item_name}\n"
+
+
+def parse_lastrun(lastrun_body):
+    """Return the items logged in the body of a lastRun file
+    :param lastrun_body: content of a lastRun file, its checkpoint or its stale list
+    :return: dictionary of file name to content hash (None for lines without one)
+    """
+    items = {}
+    for line in lastrun_body.splitlines():
+        item_name, _, content_hash = line.partition('\t')
+        if item_name:
+            items[item_name] = content_hash or None
+    return items
+
+
+def stale_lastrun_name(lastrun):
+    """Name of the stale list of a page, the items of its previous harvest that the current one did not log"""
+    return lastrun.replace('.txt', '.stale.txt')
+
+
+def reconcile_harvest(template_bucket, data_bucket, collection, total_pages):
+    """Delete the items of the previous harvests that no page of the finished harvest logged
+    Run by the gather function once every page of the harvest is done. The lastRun files of the pages of the
+    harvest, lastRun_eodms_<collection>_<index>.txt with index < total_pages, are the current items. Candidates are
+    the stale lists of the pages (see reconcile_lastrun() of the processor), the checkpoints left by pages given up
+    before their end, and the lastRun files of the pages beyond total_pages once PAGE_LIMIT is raised. A candidate is deleted only if no current lastRun logs it, since items move between pages from one harvest to the
+    next. Those lists are then deleted, unless some item could not be, so the next harvest tries again.
+    :param template_bucket: GeoCore template bucket, with the lastRun files
+    :param data_bucket: processed data bucket
+    :param collection: collection id, e.g. 'sentinel-1'
+    :param total_pages: number of pages (processes) of the finished harvest
+    :return: tuple of the current items (dictionary of file name to content hash), the number of deleted items and
+        the error message from the deletes, None if there is none
+    :raises ValueError: a lastRun file could not be read, nothing is deleted
+    """
+    prefix = f'lastRun_eodms_{collection}_'
+    page_lastrun = re.compile(re.escape(prefix) + r'(\d+)\.txt$')
+    current_items, candidates, obsolete = {}, set(), []
+    for key in list_filenames_s3(template_bucket, prefix=prefix):
+        lastrun_body = open_file_s3(template_bucket, key)
+        if lastrun_body is False:
+            raise ValueError(f'Failed to read {key} from bucket {template_bucket}')
+        match = page_lastrun.match(key)
+        if match and int(match.group(1)) < total_pages:
+            current_items.update(parse_lastrun(lastrun_body))
+        else:
+            candidates.update(parse_lastrun(lastrun_body))
+            obsolete.append(key)
+    stale_items = sorted(item_name for item_name in candidates if item_name not in current_items)
+    logging.info(f'Reconciled {collection}: {len(current_items)} current items, {len(stale_items)} stale items in {len(obsolete)} lists')
+    print(f'Reconciled {collection}: {len(current_items)} current items, {len(stale_items)} stale items in {len(obsolete)} lists')
+    e = delete_filelist_s3(deleted_filelist=stale_items, bucket=data_bucket) if stale_items else None
+    if e is None and obsolete:
+        e = delete_filelist_s3(deleted_filelist=obsolete, bucket=template_bucket)
+    return current_items, len(stale_items), e
@@ -5,6 +5,8 @@ import boto3
 import os
 from botocore.exceptions import ClientError
 from datetime import datetime
+from stream_json import read_response_fields
+from aws_clients import get_client
 
 
 def search_pages_get_json(url: str, collection:str, payload: dict = None):
@@ -48,12 +50,14 @@ def search_pages_get_json(url: str, collection:str, payload: dict = None):
     while next_page:
         try: 
             #print(f'Trying to get page: {next_page}')
-            r = requests.get(next_page)
+            r = requests.get(next_page, stream=True)
             #print(f'request response is {r}')
             
             if r.status_code == 200:
                 #print('Status code is 200')
-                j = r.json()            
+                # Only context and links are needed, the features of the page are skipped without being decoded
+                j = read_response_fields(r, ('context', 'links'))
+                r.close()
                 #print('JSON response received')
                 
                 # Test the returns total against total matched
@@ -109,7 +113,7 @@ def upload_file_s3(filename, bucket, json_data, object_name=None):
     if object_name is None:
         object_name = os.path.basename(filename)
     # boto3.client vs boto3.resources:https://www.learnaws.org/2021/02/24/boto3-resource-client/ 
-    s3_client = boto3.client('s3')  
+    s3_client = get_client('s3')  
     if json_data: 
         try:
             response = s3_client.put_object(Body=(bytes(json.dumps(json_data, indent=4, ensure_ascii=False).encode('utf-8'))), 
@@ -2,8 +2,11 @@ import requests
 import os 
 import re 
 import json
+import time
+import hashlib
 import boto3 
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from aws_lambda_powertools import Logger
 
@@ -11,7 +14,17 @@ logger = Logger()
 
 from s3_operations import *
 from stac_to_geocore_sentinel1 import *
+from stac_metadata_cache import get_stac_root, get_stac_collections
+from upload_executor import UploadExecutor
+from ndjson_output import NdjsonPageWriter
+from geoparquet_output import GeoParquetPageWriter, parquet_output
+from pipeline import run_pipeline
+from stream_json import iter_response_features
+from mapping_pool import MappingPool, mapping_workers
+from item_columns import columnar_batch_size
 from dynamo_operations import update_item_finished
+from lastrun import format_lastrun_line, parse_lastrun, stale_lastrun_name
+from aws_clients import get_client
 
 
 # environment variables for lambda
@@ -25,6 +38,17 @@ source = os.environ['SOURCE']
 sourceSystemName = os.environ['SOURCESYSTEMNAME']
 collection = os.environ['COLLECTION']
 sg_processes_table_name  = os.getenv('SG_PROCESSES_TABLE_NAME') 
+queue_url = os.getenv('QUEUE_URL') #processor queue, pages stopped before the timeout are continued with a message on it
+lastrun_mode = os.getenv('LASTRUN_MODE', 'reconcile') #'reconcile' deletes only the stale items after the harvest, 'replace' deletes all previous items first
+skip_unchanged = os.getenv('SKIP_UNCHANGED', 'true').lower() == 'true' #reconcile mode, do not PUT items whose content hash is the one in lastRun
+geocore_template_ttl = int(os.getenv('GEOCORE_TEMPLATE_TTL', '300')) #seconds before the cached template is revalidated against S3
+page_concurrency = int(os.getenv('PAGE_CONCURRENCY', '1')) #SQS records (pages) processed at the same time
+deadline_margin_ms = int(os.getenv('DEADLINE_MARGIN_MS', '60000')) #time kept in reserve before the Lambda timeout
+max_receive_count = int(os.getenv('MAX_RECEIVE_COUNT', '5')) #a page still failing after this many deliveries is marked finished
+mapping_engine = os.getenv('MAPPING_ENGINE', 'item') #'columnar' maps the items by batches of COLUMNAR_BATCH_SIZE, 'item' one at a time
+fetch_connect_timeout = float(os.getenv('FETCH_CONNECT_TIMEOUT', '10')) #seconds to connect to the STAC API for an item page
+fetch_read_timeout = float(os.getenv('FETCH_READ_TIMEOUT', '30')) #seconds without any data of the item page before the fetch fails, below DEADLINE_MARGIN_MS
+output_format = os.getenv('OUTPUT_FORMAT', 'geojson') #'geojson' writes one file per item, 'ndjson' each page as one gzip NDJSON file and its offset index, see the README before switching
 
 
 """
@@ -43,152 +67,495 @@ sg_processes_table_name  = 'scatter_gather_processes'
 
 datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+# Warm-container cache of the GeoCore null template, keyed by (bucket, template name). 
+# It lives at module level so it is shared by every item of a page and by every invocation served by this container. 
+geocore_template_cache = {}
+
 @logger.inject_lambda_context
 def lambda_handler(event, context):
-    """STAC harvesting and mapping workflow 
-        1. Before harvesting the stac records, we delete the previous harvested stac records logged in lastRun.txt.
-        2. Create an empty lastRun.txt to log the current harvest
-        3. Loop through items within the collection, harvest the item json bady and map item to GeoCore. 
-        4. Update lastRun.txt 
+    """Process every SQS record (one item-api page each) of the batch 
+    Pages run concurrently, up to PAGE_CONCURRENCY at a time. The function reports partial batch failures 
+    (ReportBatchItemFailures), so only the records listed in batchItemFailures are redelivered by SQS. 
     """
     #sample event in events/processor.json
     logger.info({"action":"invoke_lambda", "payload":{"event":event}})
-    json_body = json.loads(event["Records"][0]["body"])
+    records = event["Records"]
+    
+    if page_concurrency > 1 and len(records) > 1:
+        # Forking mapping workers from several threads is unsafe, pages processed concurrently map in-process 
+        with ThreadPoolExecutor(max_workers=min(page_concurrency, len(records)), thread_name_prefix='page') as executor:
+            errors = list(executor.map(lambda record: process_record(record, context, use_mapping_pool=False), records))
+    else:
+        errors = [process_record(record, context) for record in records]
+    
+    batch_item_failures = [{"itemIdentifier": record["messageId"]} for record, error_msg in zip(records, errors) if error_msg]
+    logger.info({"action":"processed_batch", "payload":{"records":len(records), "batchItemFailures":batch_item_failures}})
+    return {
+        "statusCode": 200 if not batch_item_failures else 400,
+        "status": "success" if not batch_item_failures else "error",
+        "batchItemFailures": batch_item_failures
+        }
+
+
+def process_record(record, context, use_mapping_pool=True):
+    """Process the item-api page of one SQS record and update its status in Dynamo 
+    :param record: SQS record, its body is the message sent by the scatter function 
+    :param context: Lambda context, used to avoid starting a page without enough time left 
+    :param use_mapping_pool: allow the multi-process mapping (MAPPING_WORKERS), only when pages run sequentially 
+    :return: error message, empty if the record must not be redelivered 
+    """
+    json_body = json.loads(record["body"])
+    receive_count = int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+    if receive_count > max_receive_count:
+        # The previous deliveries never returned (e.g. the page hits the Lambda timeout every time), so the give-up 
+        # below was never reached: give the page up without processing it again 
+        error_msg, continued = f'Not finished after {receive_count - 1} deliveries', False
+    elif context is not None and context.get_remaining_time_in_millis() < deadline_margin_ms:
+        # Not started, SQS redelivers the record to a fresh invocation 
+        logger.warning({"action":"skip_record", "payload":{"messageId":record["messageId"], "reason":"not enough time left"}})
+        return 'Not enough time left to process the page'
+    else:
+        try:
+            error_msg, continued = process_page(json_body, context, use_mapping_pool=use_mapping_pool)
+        except Exception as e:
+            logger.exception({"action":"process_page", "payload":{"messageId":record["messageId"]}})
+            error_msg, continued = f'{type(e).__name__}: {e}', False
+    
+    if error_msg and receive_count < max_receive_count:
+        # Failed pages stay "started" and are retried, finishing them now would make the aggregator count them twice 
+        return error_msg
+    if error_msg:
+        logger.error({"action":"give_up_page", "payload":{"messageId":record["messageId"], "receive_count":receive_count, "error":error_msg}})
+    if continued:
+        # The rest of the page was queued as a continuation message, the page is finished once the last part is done 
+        return ''
+    
+    # Update the status item in Dynamo, when a Processor Function finishes, it updates the item status to “finished” in the DynamoDB SGProcessesDBTable
+    item_state = json_body.get("item_state") #item-state included one item from the scatter_gather_processes table 
+    update_item_finished(sg_processes_table_name, item_state)
+    logger.info({"action":"update_item", "payload":{"item_state":item_state}})
+    return ''
+
+
+def process_page(json_body, context=None, use_mapping_pool=True):
+    """STAC harvesting and mapping workflow of one item-api page 
+        1. Before harvesting the stac records, we delete the previous harvested stac records logged in lastRun.txt 
+           (LASTRUN_MODE 'replace' only).
+        2. Create an empty lastRun.txt to log the current harvest
+        3. Loop through items within the collection, harvest the item json bady and map item to GeoCore. 
+           With OUTPUT_FORMAT 'ndjson' the items are written to one page file and its index (see NdjsonPageWriter), 
+           which are logged in lastRun.txt in place of the items; with 'geojson' every item is uploaded to its own file. 
+           With PARQUET_OUTPUT the items are also written to a GeoParquet part file (see GeoParquetPageWriter). 
+           Files whose content hash is unchanged since the previous lastRun.txt are not uploaded again (SKIP_UNCHANGED). 
+        4. List the items of the previous lastRun.txt missing from the current harvest in lastRun.stale.txt, the gather 
+           function deletes them once every page of the harvest is done (LASTRUN_MODE 'reconcile' only). 
+        5. Update lastRun.txt 
+    When the Lambda timeout gets close, the page stops after the items mapped so far (written to a page file of their 
+    own, named after the item offset the invocation started at): the log of the current harvest is uploaded as a checkpoint and a continuation message (the same message with the item offset to resume at) is sent 
+    to the queue. The continuation skips steps 1 and 2 and appends to the checkpoint instead. 
+    :param json_body: decoded body of the SQS message 
+    :param context: Lambda context, used to stop before the timeout 
+    :param use_mapping_pool: allow the multi-process mapping (MAPPING_WORKERS) 
+    :return: tuple of the error message, empty if the page succeeded, and True if a continuation message was sent 
+    :raises ValueError: the lastRun file or the checkpoint of the page could not be read, the page is retried 
+    """
     item_event = json_body.get("item-api")
     index_event = json_body.get("index")
+    offset = json_body.get("offset", 0) #first item not processed by previous invocations
+    next_offset = None 
+    continued = False 
     
     lastrun = f'lastRun_eodms_{collection}_{index_event}.txt'
+    checkpoint = lastrun.replace('.txt', '.partial.txt') #lastRun keeps the previous harvest until the page is complete
+    page_name = f'{source}-{collection}-page-{index_event}-{offset}'
+    if output_format == 'ndjson':
+        page_file = NdjsonPageWriter(page_name)
+    else:
+        page_file = None
+    if parquet_output:
+        parquet_file = GeoParquetPageWriter(page_name)
+    else:
+        parquet_file = None
     
     error_msg = ''
+    written = skipped = stale = 0
+    harvested = False #the fetch → map → upload pipeline went through the page (or up to the deadline) without any error
     #Change directory to /tmp folder, required if new files are created in this lambda 
     os.chdir('/tmp')    
     if not os.path.exists(os.path.join('mydir')):
         os.makedirs('mydir')
 
-    # Start the harvest and translation process if connection is okay 
-    response_root = requests.get(f'{api_root}')
-    if response_root.status_code == 200:
-        e = delete_stac_s3(bucket_geojson=processed_data_bucket_name, bucket_template=geocore_template_bucket_name, filename=lastrun)
-        if e != None: 
-            error_msg += e
-        # Create a new log file for each sucessfull item harvest  
-        print(f'Creating a new {lastrun}')
+    # Start the harvest and translation process if the root and collections metadata are available 
+    try:
+        params = get_root_params()
+    except ValueError as e:
+        params = None
+        print(f'Request failed: {e}')
+        error_msg += f'Request failed: {e}\n'
+    if params is not None:
+        if offset == 0:
+            if lastrun_mode == 'replace':
+                e = delete_stac_s3(bucket_geojson=processed_data_bucket_name, bucket_template=geocore_template_bucket_name, filename=lastrun)
+                if e != None: 
+                    error_msg += e
+            # Create a new log file for each sucessfull item harvest  
+            print(f'Creating a new {lastrun}')
+            logged_items = {}
+        else:
+            # Continuation of the page, the checkpoint lists the items of this harvest uploaded so far 
+            print(f'Resuming {item_event} at item {offset}')
+            logged_items = load_lastrun(checkpoint)
+        # The previous lastRun is both the list of items to reconcile and the content hash index of the bucket 
+        previous_items = load_lastrun(lastrun) if lastrun_mode == 'reconcile' else {}
         with open(f'/tmp/{lastrun}', 'w') as f:
-            # Catalog Level  
+            f.writelines(format_lastrun_line(item_name, content_hash) for item_name, content_hash in logged_items.items())
             try: 
-                root_data_json = response_root.json()
-                root_id = root_data_json['id']
-                if root_id.isspace()==False:
-                    root_id=root_id.replace(' ', '-')
-                root_des = root_data_json['description']
-                root_links = root_data_json['links']
-    
-               # GeoCore properties bounding box is a required for frontend, here we use the first collection
-               #?TBD using first collection bounding box could cause potential issues when collections have different extent, a solution is required. 
-                response_collection = requests.get(f'{api_root}/collections/')
-                collection_data_list = response_collection.json()['collections']
-                root_bbox = collection_data_list[1]['extent']['spatial']['bbox']
-                
-                # Perpare for parametes required for the function 
-                params = {
-                        'root_name': root_name, 
-                        'root_links': root_links, 
-                        'root_id': root_id, 
-                        'root_des': root_des, 
-                        'root_bbox': root_bbox,
-                        'source': source,  
-                        'status':status,
-                        'maintenance':maintenance, 
-                        'useLimits_en': useLimits_en,
-                        'useLimits_fr': useLimits_fr,
-                        'spatialRepresentation': spatialRepresentation,
-                        'contact': contact,
-                        'type_data': type_data,
-                        'topicCategory': topicCategory,
-                        'sourceSystemName':sourceSystemName,
-                        'eoCollection':collection,
-                        "coll_description_en": coll_description_en, 
-                        "coll_description_fr": coll_description_fr,
-                        "coll_keywords_fr": coll_keywords_fr 
-                        }
-                        
-                item_count = 0 
                 # Get the collection level keywords, description, and titles   
                 coll_id_dict = create_coll_dict(api_root, collection, coll_description_en,coll_description_fr,coll_keywords_fr)
                 
-                r = requests.get(item_event)
-                if r.status_code == 200:
-                    try:
-                        j = r.json()
-                        items_list = j['features']
-                        for item in items_list: 
-                            item_id, item_bbox, item_links, item_assets, item_properties,coll_id = get_item_fields(item)
-                            print(f'Starting maping item {item_count}: {item_id}')
-                            geocore_features_dict = get_geocore_template(geocore_template_bucket_name,geocore_template_name)
-                            item_geometry_dict = to_features_geometry(geocore_features_dict=geocore_features_dict, bbox=item_bbox, geometry_type='Polygon')
-                                
-                            item_properties_dict = item_to_features_properties(params=params, geocore_features_dict=geocore_features_dict, item_dict=item, coll_id_dict=coll_id_dict)
-                            item_geocore_updated = update_geocore_dict(geocore_features_dict=geocore_features_dict, properties_dict =item_properties_dict ,geometry_dict=item_geometry_dict)
-                            item_name = source + '-' + coll_id + '-' + item_id + '.geojson'
-                            
-
-                            msg = upload_file_s3(item_name, bucket=processed_data_bucket_name, json_data=item_geocore_updated, object_name=None)
-                            
-                            if msg == True: 
-                                item_count += 1 
-                                print(f'Finished and uploaded the item to bucket: {processed_data_bucket_name}')  
-                                f.write(f"{item_name}\n")
-                            """
-                            # add the logging information with logger 
-                            logger.info({"action":"harvest and translate item", "payload":{"item_event":item_event, "db":ATHENA_RAW_DATABASE_NAME}})
-                            logger.info({"action":"Upload item to S3", "payload":{"s3":processed_data_bucket_name}})
-                            """
-                    except json.JSONDecodeError:
-                        print("Response is not in JSON format. Raw response:", r.text)
-                    
-                else: 
-                    print('Request failed:r is {item_event}.  Status code: {r.status_code}. Response: {r.text}')
-            except json.JSONDecodeError:
-                # Handle JSON decode error
-                print("response_root is not in JSON format. Raw response:", response_root.text)
+                # Items are logged in lastRun only once their upload succeeded, in the order of the page 
+                def log_item(item_name, content_hash):
+                    if item_name not in logged_items:
+                        f.write(format_lastrun_line(item_name, content_hash))
+                        logged_items[item_name] = content_hash
+                
+                pending_hashes = {}
+                def log_uploaded_item(index, item_name):
+                    if item_name.endswith('.geojson'):
+                        print(f'Finished and uploaded the item {offset + index} to bucket: {processed_data_bucket_name}')  
+                    else:
+                        print(f'Finished and uploaded {item_name} to bucket: {processed_data_bucket_name}')
+                    log_item(item_name, pending_hashes.pop(item_name, None))
+                
+                # Upload stage: hash the serialized document, skip the PUT if S3 already holds the same content 
+                def upload_if_changed(mapped, encoded=False):
+                    nonlocal skipped
+                    item_name, body = mapped
+                    if not isinstance(body, (bytes, bytearray)):
+                        body = serialize_json(body)
+                    content_hash = hashlib.md5(body).hexdigest()
+                    if skip_unchanged and previous_items.get(item_name) == content_hash:
+                        log_item(item_name, content_hash)
+                        skipped += 1
+                        return
+                    pending_hashes[item_name] = content_hash
+                    uploader.submit(item_name, body, encoded=encoded)
+                
+                # Write stage: every item goes to its own file or to the page file, and to the GeoParquet part file 
+                item_writers = [upload_if_changed if page_file is None else page_file.add]
+                if parquet_file is not None:
+                    item_writers.append(parquet_file.add)
+                def write_item(mapped):
+                    for write in item_writers:
+                        write(mapped)
+                
+                # Stop mapping before the Lambda timeout, only if the rest of the page can be queued 
+                def deadline_reached():
+                    return context is not None and context.get_remaining_time_in_millis() < deadline_margin_ms
+                
+                # Item mapping of the page, compiled from the mapping spec of the collection 
+                map_items = bind_item_mapping(params, coll_id_dict)
+                # Columnar engine: items are mapped by batches, the documents are the same as item by item 
+                map_batch = (lambda batch: map_stac_items(batch, map_items)) if mapping_engine == 'columnar' else None
+                
+                if use_mapping_pool and mapping_workers > 1:
+                    # Multi-core mapping: the page is fetched first, then sharded across MAPPING_WORKERS processes. 
+                    # The mapping is bound before forking so every worker inherits it together with the template. 
+                    mapping_pool = MappingPool(
+                        items=list(fetch_page_items(item_event, start=offset)), 
+                        map_item=lambda item: map_stac_item(item, map_items), 
+                        serialize=serialize_json if page_file is None else serialize_compact, 
+                        map_batch=map_batch
+                        )
+                    page_source, map_item, pipeline_map_batch = mapping_pool.results(), lambda mapped: mapped, None
+                else:
+                    page_source, map_item = fetch_page_items(item_event, start=offset), lambda item: map_stac_item(item, map_items)
+                    pipeline_map_batch = map_batch
+                
+                # fetch → map → upload pipeline: items are mapped while the page is still being fetched, and the uploads 
+                # (UPLOAD_CONCURRENCY PUTs in flight) overlap with the mapping of the next items. 
+                # With a page file, the documents are compressed as they are mapped and the file is uploaded at the end 
+                with UploadExecutor(bucket=processed_data_bucket_name, on_success=log_uploaded_item) as uploader:
+                    mapped_count, completed = run_pipeline(
+                        source=page_source, 
+                        map_item=map_item, 
+                        sink=write_item, 
+                        should_stop=deadline_reached if queue_url else None, 
+                        map_batch=pipeline_map_batch, 
+                        batch_size=columnar_batch_size
+                        )
+                    if page_file is not None and page_file.count:
+                        data_file, index_file = page_file.close()
+                        upload_if_changed(data_file, encoded=True)
+                        # The index is uploaded once the page file exists, it never points to a missing file 
+                        uploader.collect(wait=True)
+                        if not uploader.failures:
+                            upload_if_changed(index_file)
+                    if parquet_file is not None and parquet_file.count:
+                        upload_if_changed(parquet_file.close(), encoded=True)
+                    """
+                    # add the logging information with logger 
+                    logger.info({"action":"harvest and translate item", "payload":{"item_event":item_event, "db":ATHENA_RAW_DATABASE_NAME}})
+                    logger.info({"action":"Upload item to S3", "payload":{"s3":processed_data_bucket_name}})
+                    """
+                
+                written = uploader.succeeded
+                if page_file is not None:
+                    print(f'Wrote {page_file.count} items to {page_file.key}')
+                if parquet_file is not None:
+                    print(f'Wrote {parquet_file.count} items to {parquet_file.key}')
+                print(f'Uploaded {uploader.succeeded} of {uploader.submitted} files to bucket: {processed_data_bucket_name}, {skipped} unchanged files skipped')
+                for index, item_name, e in uploader.failures:
+                    logger.error({"action":"upload_item", "payload":{"index":index, "item_name":item_name, "exception":str(e)}})
+                    error_msg += f'Failed to upload item {index} {item_name}: {e}\n'
+                if not completed:
+                    next_offset = offset + mapped_count
+                    print(f'Stopped {item_event} at item {next_offset} before the Lambda timeout')
+                harvested = True
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                # The page could not be fetched, the items uploaded so far are still logged in lastRun 
+                print(f'Failed to fetch the item page {item_event}: {e}')
+                error_msg += f'Failed to fetch the item page {item_event}: {e}\n'
+            except Exception as e:
+                # An item could not be mapped, e.g. it has no title or datetime; the page is retried 
+                logger.exception({"action":"map_page", "payload":{"item_event":item_event}})
+                error_msg += f'Failed to map the item page {item_event}: {type(e).__name__}: {e}\n'
                     
         f.close()
-        print(f'This is lastrun: {lastrun}')
-        msg = upload_file_s3(filename=lastrun, bucket=geocore_template_bucket_name, json_data = None, object_name=None)
-        if msg == True: 
-            print(f'Finished mapping the EODMS Sentinal datacube and uploaded the lastRun.txt to bucket: {geocore_template_bucket_name}')   
-    else:
-        print('Request failed:root_api is {api_root}.  Status code: {response.status_code}. Response: {response.text}')
+        if next_offset is not None:
+            # Continue only from a consistent checkpoint, and only after some progress so a page can not loop forever 
+            msg = upload_file_s3(filename=lastrun, bucket=geocore_template_bucket_name, json_data = None, object_name=checkpoint)
+            if error_msg or msg != True or next_offset == offset:
+                error_msg += f'Stopped {item_event} at item {next_offset} before the Lambda timeout\n'
+            else:
+                send_continuation_message(json_body, next_offset)
+                continued = True
+        elif error_msg and offset != 0:
+            # A failed continuation leaves lastRun as it is and keeps the checkpoint, completed with the items logged by 
+            # this attempt, so the retry resumes from it and the items of the previous parts are not taken as stale 
+            upload_file_s3(filename=lastrun, bucket=geocore_template_bucket_name, json_data = None, object_name=checkpoint)
+        else:
+            if lastrun_mode == 'reconcile':
+                # Stale items are listed for the gather function only once the whole page was harvested without any error 
+                stale, e = reconcile_lastrun(lastrun, previous_items, logged_items, keep_previous=bool(error_msg) or not harvested)
+                if e != None: 
+                    error_msg += e
+            print(f'This is lastrun: {lastrun}')
+            msg = upload_file_s3(filename=lastrun, bucket=geocore_template_bucket_name, json_data = None, object_name=None)
+            if msg == True: 
+                print(f'Finished mapping the EODMS Sentinal datacube and uploaded the lastRun.txt to bucket: {geocore_template_bucket_name}')   
+            if offset != 0:
+                delete_filelist_s3(deleted_filelist=[checkpoint], bucket=geocore_template_bucket_name)
+        logger.info({"action":"page_summary", "payload":{"item_event":item_event, "offset":offset, "next_offset":next_offset, "written":written, "skipped":skipped, "stale":stale}})
         
     
-    # Update the status item in Dynamo, when a Processor Function finishes, it updates the item status to “finished” in the DynamoDB SGProcessesDBTable
-    item_state = json_body.get("item_state") #item-state included one item from the scatter_gather_processes table 
-    update_item_finished(sg_processes_table_name, item_state)
-    logger.info({"action":"update_item", "payload":{"item_state":item_state}})
+    return error_msg, continued
 
+
+def get_root_params():
+    """Root level parameters of the mapping, from the STAC root and /collections/ documents 
+    Root and /collections documents are served by the STAC metadata cache shared with the collector. 
+    :return: dictionary of the parameters, see process_page 
+    :raises ValueError: the root or collections metadata is unavailable or incomplete, the page must be retried 
+    """
+    root_data_json = get_stac_root(api_root)
+    if not root_data_json:
+        raise ValueError(f'root_api {api_root} is not available')
+    collection_data_list = get_stac_collections(api_root)
+    if not collection_data_list:
+        raise ValueError(f'the collections of {api_root} are not available')
+    # Catalog Level  
+    try:
+        root_id = root_data_json['id']
+        if root_id.isspace()==False:
+            root_id=root_id.replace(' ', '-')
+        root_des = root_data_json['description']
+        root_links = root_data_json['links']
+        
+        # GeoCore properties bounding box is a required for frontend, here we use the first collection
+        #?TBD using first collection bounding box could cause potential issues when collections have different extent, a solution is required. 
+        root_bbox = collection_data_list[1]['extent']['spatial']['bbox']
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f'the root or collections metadata of {api_root} is missing a required field: {e!r}')
+    
+    # Perpare for parametes required for the function 
     return {
-        "statusCode": 200 if not error_msg else 400,
-        "status": "success" if not error_msg else "error"
-        }
+            'root_name': root_name, 
+            'root_links': root_links, 
+            'root_id': root_id, 
+            'root_des': root_des, 
+            'root_bbox': root_bbox,
+            'source': source,  
+            'status':status,
+            'maintenance':maintenance, 
+            'useLimits_en': useLimits_en,
+            'useLimits_fr': useLimits_fr,
+            'spatialRepresentation': spatialRepresentation,
+            'contact': contact,
+            'type_data': type_data,
+            'topicCategory': topicCategory,
+            'sourceSystemName':sourceSystemName,
+            'eoCollection':collection,
+            "coll_description_en": coll_description_en, 
+            "coll_description_fr": coll_description_fr,
+            "coll_keywords_fr": coll_keywords_fr 
+            }
+
+
+def load_lastrun(lastrun):
+    """Return the items logged in a lastRun file (or its checkpoint) of the GeoCore template bucket 
+    :param lastrun: name of the lastRun file 
+    :return: dictionary of file name to content hash (None for lines without one), empty if there is no such file 
+    :raises ValueError: the file exists but could not be read. Taken as empty, its items would be listed as stale 
+        (or, for a checkpoint, the items of the previous parts), so the page is retried instead 
+    """
+    metadata = head_file_s3(geocore_template_bucket_name, lastrun)
+    if metadata is None:
+        print(f"No existing {lastrun} in the bucket {geocore_template_bucket_name}")
+        return {}
+    lastrun_body = open_file_s3(geocore_template_bucket_name, lastrun) if metadata else False
+    if lastrun_body is False:
+        raise ValueError(f'Failed to read {lastrun} from bucket {geocore_template_bucket_name}')
+    return parse_lastrun(lastrun_body)
+
+
+def reconcile_lastrun(lastrun, previous_items, current_items, keep_previous=False):
+    """Differential alternative to delete_stac_s3: once the page is harvested, list the items of the previous harvest 
+    that are not part of the current one in the stale list of the page (lastRun_..._<index>.stale.txt). Items are 
+    compared as hashed sets, in linear time. They are not deleted here: an item can move to another page between two 
+    harvests (new items, another PAGE_LIMIT), so the gather function deletes the stale items that no page of the 
+    harvest logged, see reconcile_harvest(). 
+    :param lastrun: name of the lastRun file, the local copy in /tmp logs the current harvest 
+    :param previous_items: items of the previous lastRun, see load_lastrun() 
+    :param current_items: file names logged by the current harvest of the page 
+    :param keep_previous: the harvest is incomplete, nothing is listed and the previous items stay in lastRun 
+    :return: tuple of the number of stale items and the error message from the upload of the list, None if there is none 
+    """
+    stale_items = [item_name for item_name in previous_items if item_name not in current_items]
+    print(f'Reconciled {lastrun}: {len(current_items)} current items, {len(stale_items)} stale items')
+    if not stale_items:
+        return 0, None
+    e = None
+    if not keep_previous:
+        stale_list = stale_lastrun_name(lastrun)
+        with open(f'/tmp/{stale_list}', 'w') as f:
+            f.writelines(format_lastrun_line(item_name) for item_name in stale_items)
+        if upload_file_s3(filename=stale_list, bucket=geocore_template_bucket_name, json_data=None, object_name=None):
+            return len(stale_items), None
+        e = f'Failed to upload {stale_list} to bucket {geocore_template_bucket_name}\n'
+    # Items missing from an incomplete harvest (or not listed) may still exist, they remain tracked for the next run 
+    with open(f'/tmp/{lastrun}', 'a') as f:
+        f.writelines(format_lastrun_line(item_name, previous_items[item_name]) for item_name in stale_items)
+    return 0, e
+
+
+def send_continuation_message(json_body, offset):
+    """Queue the rest of a page, the continuation message is the original message with the item offset to resume at 
+    :param json_body: decoded body of the SQS message of the page 
+    :param offset: index of the first item of the page not processed yet 
+    """
+    message = json.dumps(dict(json_body, offset=offset))
+    sqs_client = get_client("sqs")
+    response = sqs_client.send_message(
+        QueueUrl=queue_url,
+        MessageBody=message
+    )
+    logger.info({"action":"send_continuation_message", "payload":{"message":message,"response":response}})
     
 
-# requires open_file_s3()
+# Fetch stage of the processor pipeline 
+def fetch_page_items(item_api, start=0):
+    """Yield the STAC items of one item-api page as they are decoded from the response stream 
+    Every feature is reduced to its StacItem record (item_record()) as soon as it is decoded, so the items waiting 
+    to be mapped only keep the fields the mapping reads. 
+    :param item_api: url of the STAC items page 
+    :param start: index of the first item to yield, the items before it are skipped without decoding them 
+    :raises requests.exceptions.RequestException, json.JSONDecodeError: the page could not be fetched (or stalled for 
+        FETCH_READ_TIMEOUT seconds), so it is retried 
+    :raises KeyError: an item has no title or datetime property 
+    """
+    r = requests.get(item_api, stream=True, timeout=(fetch_connect_timeout, fetch_read_timeout))
+    try:
+        if r.status_code != 200:
+            print(f'Request failed:r is {item_api}.  Status code: {r.status_code}. Response: {r.text}')
+            raise requests.exceptions.HTTPError(f'Status code {r.status_code}', response=r)
+        for feature in iter_response_features(r, start):
+            yield item_record(feature)
+    finally:
+        r.close()
+
+
+# Map stage of the processor pipeline 
+def bind_item_mapping(params, coll_id_dict):
+    """Compile the item mapping of a page (item_mapping of the stac_to_geocore module) with the GeoCore template 
+    :param params: root level parameters, see lambda_handler 
+    :param coll_id_dict: collection level keywords, description, and titles from create_coll_dict() 
+    :return: function mapping a list of StacItem records to the list of their GeoCore dictionaries 
+    :raises ValueError: the GeoCore template could not be loaded 
+    """
+    template = get_geocore_template(geocore_template_bucket_name,geocore_template_name)
+    if template is None:
+        raise ValueError(f'The GeoCore template {geocore_template_name} could not be loaded from bucket: {geocore_template_bucket_name}')
+    return item_mapping.bind(params, coll_id_dict, template)
+
+
+def map_stac_item(item, map_items):
+    """Map one STAC item to GeoCore 
+    :param item: StacItem record of a STAC item (feature), see item_record() 
+    :param map_items: mapping of the page, see bind_item_mapping() 
+    :return: tuple of the GeoCore file name and the GeoCore dictionary 
+    """
+    print(f'Starting maping item: {item.id}')
+    return map_stac_items([item], map_items)[0]
+
+
+# Map stage of the processor pipeline, columnar engine 
+def map_stac_items(items, map_items):
+    """Map a batch of STAC items to GeoCore (MAPPING_ENGINE 'columnar'), the documents are the same as item by item 
+    :param items: list of StacItem records of STAC items (features) 
+    :param map_items: mapping of the page, see bind_item_mapping() 
+    :return: list of tuples of the GeoCore file name and the GeoCore dictionary, same as map_stac_item for every item 
+    """
+    if len(items) > 1:
+        print(f'Starting maping a batch of {len(items)} items')
+    return [
+        (source + '-' + item.collection + '-' + item.id + '.geojson', item_geocore_updated)
+        for item, item_geocore_updated in zip(items, map_items(items))
+        ]
+
+
+# requires open_file_s3_if_modified(), compile_geocore_template()
 def get_geocore_template(geocore_template_bucket_name,geocore_template_name):
-    """Getting GeoCore null template from S3 bucket  
+    """Getting GeoCore null template from S3 bucket, served from the warm-container cache 
+    The template is downloaded and compiled once per container and revalidated with a conditional GET (ETag) 
+    once the cached copy is older than GEOCORE_TEMPLATE_TTL seconds. 
     Parameters:
     - geocore_template_bucket_name: S3 bucket name that stores the GeoCore template.
     - geocore_template_name: Name of the GeoCore template file.
     
     Returns:
-    - A dictionary containing the GeoCore feature, or None if an error occurs. 
+    - A new instance of the dictionary containing the GeoCore feature, safe to mutate, or None if an error occurs. 
     """  
+    cache_key = (geocore_template_bucket_name, geocore_template_name)
+    cached = geocore_template_cache.get(cache_key)
+    if cached and time.monotonic() - cached['checked_at'] < geocore_template_ttl:
+        return cached['build']()
     try: 
-        template= open_file_s3(geocore_template_bucket_name, geocore_template_name)
+        template, etag = open_file_s3_if_modified(geocore_template_bucket_name, geocore_template_name, etag=cached['etag'] if cached else None)
+        if template is None:
+            # Not modified since the last download, keep serving the cached copy 
+            cached['checked_at'] = time.monotonic()
+            return cached['build']()
         if not template: 
             logging.error("Template not found.")
-            return None           
+            return cached['build']() if cached else None
         geocore_dict = json.loads(template)
-        return geocore_dict['features'][0] 
+        geocore_template_cache[cache_key] = {
+            'build': compile_geocore_template(geocore_dict['features'][0]), 
+            'etag': etag, 
+            'checked_at': time.monotonic()
+            }
+        return geocore_template_cache[cache_key]['build']()
     except ClientError as e:
         logging.error(f"An error occurred while accessing S3: {e}")
         return None
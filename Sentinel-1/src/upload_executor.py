@@ -0,0 +1,100 @@
+import os
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import get_client
+from s3_operations import upload_file_s3, content_encoders
+
+upload_concurrency = int(os.getenv('UPLOAD_CONCURRENCY', '16')) #maximum number of S3 PUTs in flight per processor
+upload_content_encoding = os.getenv('UPLOAD_CONTENT_ENCODING') or None #optional 'gzip' or 'zstd' Content-Encoding of the uploaded documents
+
+
+class UploadExecutor:
+    """Upload GeoCore documents to S3 concurrently, with a bounded number of PUTs in flight
+
+    submit() returns as soon as the PUT is queued, so the caller keeps mapping the next item while
+    previous uploads are on the network. When max_in_flight PUTs are outstanding, submit() blocks
+    until one finishes, which also bounds the number of mapped documents held in memory.
+
+    Documents are compressed in the upload threads when a Content-Encoding is set (UPLOAD_CONTENT_ENCODING).
+
+    Completions are tracked in submission order: on_success(index, filename) is called from the
+    submitting thread, in order, and only once the PUT has succeeded, so it is safe to log the
+    file to lastRun from it. Failed uploads are collected in failures as (index, filename, error).
+
+    Usage:
+        with UploadExecutor(bucket, on_success=log_item) as uploader:
+            for item in items:
+                uploader.submit(item_name, geocore_dict)
+        print(uploader.succeeded, uploader.failures)
+    """
+
+    def __init__(self, bucket, max_in_flight=None, on_success=None, content_encoding=None):
+        self.bucket = bucket
+        self.content_encoding = content_encoding or upload_content_encoding
+        if self.content_encoding and self.content_encoding not in content_encoders:
+            raise ValueError(f'Unsupported Content-Encoding {self.content_encoding}, available: {sorted(content_encoders)}')
+        self.max_in_flight = max(1, max_in_flight or upload_concurrency)
+        self.on_success = on_success
+        # boto3 clients are thread safe, the shared client (and connection pool) is used by all upload threads
+        self.s3_client = get_client('s3')
+        self.pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='s3-upload')
+        self.slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.pending = deque() #(index, filename, future) in submission order
+        self.submitted = 0
+        self.completed = 0 #length of the finished prefix of the submissions, in order
+        self.succeeded = 0
+        self.failures = []
+
+    def submit(self, filename, json_data, encoded=False):
+        """Queue the upload of json_data as filename, blocking while max_in_flight uploads are outstanding
+        :param encoded: json_data is already compressed (e.g. a .gz file), it is uploaded as it is, without Content-Encoding
+        :return: the submission index of the upload
+        """
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(upload_file_s3, filename, self.bucket, json_data, None, self.s3_client, None if encoded else self.content_encoding)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        index = self.submitted
+        self.pending.append((index, filename, future))
+        self.submitted += 1
+        self.collect()
+        return index
+
+    def collect(self, wait=False):
+        """Record the uploads finished at the head of the submission order
+        :param wait: block until every submitted upload has finished
+        """
+        while self.pending and (wait or self.pending[0][2].done()):
+            index, filename, future = self.pending.popleft()
+            try:
+                error = None if future.result() else 'upload_file_s3 returned False'
+            except Exception as e:
+                error = e
+            self.completed = index + 1
+            if error is None:
+                self.succeeded += 1
+                if self.on_success:
+                    self.on_success(index, filename)
+            else:
+                logging.error(f'Failed to upload {filename} to bucket {self.bucket}: {error}')
+                self.failures.append((index, filename, error))
+
+    def close(self):
+        """Wait for all outstanding uploads and release the upload threads"""
+        try:
+            self.collect(wait=True)
+        finally:
+            self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
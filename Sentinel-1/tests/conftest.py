@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+# The Lambda modules are flat files of src/, imported the way the Lambda runtime does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Environment of the processor function, see geocore-eo-sentinel1-harvester.yml. Nothing is sent to AWS or to the
+# STAC API, the tests replace the S3 and HTTP calls of the functions they run.
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ca-central-1')
+os.environ.setdefault('GEOCORE_TEMPLATE_BUCKET_NAME', 'geocore-template')
+os.environ.setdefault('GEOCORE_TEMPLATE_NAME', 'geocore-format-null-template.json')
+os.environ.setdefault('PROCESSED_DATA_BUCKET_NAME', 'processed-data')
+os.environ.setdefault('API_ROOT', 'https://api.test/stac')
+os.environ.setdefault('ROOT_NAME', 'EODMS Datacube API / EODMS Cube de données API')
+os.environ.setdefault('SOURCE', 'eodms')
+os.environ.setdefault('SOURCESYSTEMNAME', 'ccmeo-eodms')
+os.environ.setdefault('COLLECTION', 'sentinel-1')
+
+import aws_clients  # noqa: E402, after the sys.path of src/
+import processor  # noqa: E402
+import stac_to_geocore_sentinel1 as stac_to_geocore  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+PAGE_URL = 'https://api.test/stac/collections/sentinel-1/items?limit=5000'
+
+
+class FakeS3Client:
+    """In-memory S3 of the calls made by s3_operations and UploadExecutor, buckets are dictionaries of key to bytes"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.failing = set() #keys whose reads and writes fail with an internal error
+
+    def check(self, Key, operation_name):
+        if Key in self.failing:
+            raise ClientError({'Error': {'Code': '500', 'Message': 'Internal Error'}}, operation_name)
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, {})
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self.check(Key, 'PutObject')
+        self.bucket(Bucket)[Key] = bytes(Body)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as f:
+            self.bucket(Bucket)[Key] = f.read()
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.check(Key, 'GetObject')
+        if Key not in self.bucket(Bucket):
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': Key}}, 'GetObject')
+        return {'Body': FakeBody(self.bucket(Bucket)[Key])}
+
+    def head_object(self, Bucket, Key):
+        self.check(Key, 'HeadObject')
+        if Key not in self.bucket(Bucket):
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.bucket(Bucket)[Key])}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.bucket(Bucket).pop(obj['Key'], None)
+        return {}
+
+    def get_paginator(self, operation_name):
+        return FakeListPaginator(self)
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeListPaginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix=''):
+        yield {'Contents': [{'Key': key} for key in sorted(self.client.bucket(Bucket)) if key.startswith(Prefix)]}
+
+
+class FakeS3Resource:
+    def __init__(self, client):
+        self.meta = type('Meta', (), {'client': client})
+
+    def Object(self, bucket, key):
+        client = self.meta.client
+        return type('Object', (), {'get': lambda obj: client.get_object(Bucket=bucket, Key=key)})()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """Replace the shared S3 client and resource (aws_clients) by an in-memory S3"""
+    client = FakeS3Client()
+    monkeypatch.setitem(aws_clients.clients, 's3', client)
+    monkeypatch.setitem(aws_clients.resources, 's3', FakeS3Resource(client))
+    return client
+
+
+class FakeSQSClient:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        self.messages.append(json.loads(MessageBody))
+        return {'MessageId': str(len(self.messages))}
+
+
+class FakeResponse:
+    """Streamed response of an item page"""
+
+    def __init__(self, page, status_code=200):
+        self.status_code = status_code
+        self.body = json.dumps(page).encode('utf-8')
+        self.text = ''
+
+    def iter_content(self, chunk_size):
+        return (self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def stac_fixture():
+    with open(os.path.join(DATA, 'stac_fixture.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def harvest(s3, stac_fixture, monkeypatch):
+    """Run process_page on page 0 of the first 10 fixture items, after a previous harvest that logged old-0 and old-1
+    The continuation messages sent by the page are in harvest.messages.
+    """
+    collections = stac_fixture['collections']['collections']
+    template = stac_to_geocore.compile_geocore_template(stac_fixture['geocore_template']['features'][0])
+    monkeypatch.setattr(processor, 'get_stac_root', lambda api_root, ttl=None: stac_fixture['root'])
+    monkeypatch.setattr(processor, 'get_stac_collections', lambda api_root, ttl=None: collections)
+    monkeypatch.setattr(stac_to_geocore, 'get_stac_collections', lambda api_root, ttl=None: collections)
+    monkeypatch.setattr(processor, 'get_geocore_template', lambda bucket, name: template())
+    monkeypatch.setattr(processor, 'lastrun_mode', 'reconcile')
+    monkeypatch.setattr(processor, 'output_format', 'geojson')
+    monkeypatch.setattr(processor, 'parquet_output', False)
+    monkeypatch.setattr(processor, 'queue_url', 'https://sqs.test/processor')
+    sqs = FakeSQSClient()
+    monkeypatch.setitem(aws_clients.clients, 'sqs', sqs)
+    monkeypatch.chdir('/tmp')
+    for key in ['old-0.geojson', 'old-1.geojson']:
+        s3.bucket(processor.processed_data_bucket_name)[key] = b'{}'
+    s3.bucket(processor.geocore_template_bucket_name)['lastRun_eodms_sentinel-1_0.txt'] = b'old-0.geojson\th0\nold-1.geojson\th1\n'
+
+    def run(page=None, status_code=200, offset=0, context=None, use_mapping_pool=False):
+        if page is None:
+            page = dict(stac_fixture['items'], features=stac_fixture['items']['features'][:10])
+        monkeypatch.setattr(processor.requests, 'get', lambda url, stream=False, timeout=None: FakeResponse(page, status_code))
+        json_body = {"item-api": PAGE_URL, "index": 0, "offset": offset}
+        return processor.process_page(json_body, context=context, use_mapping_pool=use_mapping_pool)
+    run.messages = sqs.messages
+    return run
@@ -0,0 +1,63 @@
+"""dedup_options against the list comprehension of the per-item translation it replaces"""
+import copy
+import random
+
+import pytest
+
+from geocore_options import dedup_options
+
+
+def dedup_options_baseline(options_list):
+    return [i for n, i in enumerate(options_list) if i not in options_list[n + 1:]] # delete duplicates
+
+
+def random_value(rnd, depth=0):
+    kind = rnd.random()
+    if depth > 2 or kind < 0.4:
+        return rnd.choice(['a', 'b', None, 1, 1.0, True, 0, False, ''])
+    if kind < 0.7:
+        return [random_value(rnd, depth + 1) for _ in range(rnd.randint(0, 2))]
+    return {rnd.choice('xyz'): random_value(rnd, depth + 1) for _ in range(rnd.randint(0, 2))}
+
+
+def random_option(rnd):
+    """An option, with urls and values that are equal across types (1, 1.0, True), or another JSON value"""
+    if rnd.random() < 0.1:
+        return random_value(rnd)
+    option = {'url': rnd.choice(['u1', 'u2', None, ['l'], 1, True])}
+    for key in rnd.sample(['name', 'protocol', 'description'], rnd.randint(0, 3)):
+        option[key] = random_value(rnd)
+    return option
+
+
+def assert_same_options(options_list):
+    expected = dedup_options_baseline(options_list)
+    deduped = dedup_options(options_list)
+    # the very same option objects, in the same order
+    assert len(deduped) == len(expected)
+    assert all(option is kept for option, kept in zip(deduped, expected))
+
+
+def test_random_options_match_baseline():
+    rnd = random.Random(5)
+    for _ in range(20000):
+        options_list = [random_option(rnd) for _ in range(rnd.randint(0, 8))]
+        if options_list:
+            # repeated objects and equal copies
+            options_list += [rnd.choice(options_list) for _ in range(rnd.randint(0, 3))]
+            options_list += [copy.deepcopy(rnd.choice(options_list)) for _ in range(rnd.randint(0, 2))]
+        assert_same_options(options_list)
+
+
+@pytest.mark.parametrize('options_list', [
+    [],
+    [{'url': 'https://api.test/stac', 'protocol': 'Web', 'name': {'en': 'root', 'fr': 'root'}}] * 3,
+    [
+        {'url': 'https://t/S1A_00001.png', 'protocol': 'image/png', 'name': {'en': 'Thumbnail', 'fr': 'Vignette'}},
+        {'url': 'https://d/S1A_00001.zip', 'protocol': 'application/zip', 'name': {'en': 'data', 'fr': 'data'}},
+        {'url': 'https://t/S1A_00001.png', 'protocol': 'image/png', 'name': {'en': 'Thumbnail', 'fr': 'Vignette'}},
+        {'url': 'https://t/S1A_00001.png', 'protocol': 'image/png', 'name': {'en': 'dup', 'fr': 'dup'}},
+    ],
+])
+def test_options_match_baseline(options_list):
+    assert_same_options(options_list)
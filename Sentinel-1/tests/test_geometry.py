@@ -0,0 +1,63 @@
+"""Vectorized bbox rounding against round(), the rounding of the per-item translation"""
+import random
+import struct
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from geometry import bbox_polygons, round_array
+
+SPECIAL_VALUES = [
+    float('nan'), float('inf'), -float('inf'), 0.0, -0.0, 1e300, -1e-300, 5e-324,
+    0.125, 0.375, 2.675, 1.005, -2.675, 0.005, -0.005, 179.995, -179.995, 1e6, 1e6 + 0.005, 1e7 + 0.015,
+    ]
+
+
+def random_coordinates(count, seed=7):
+    """Longitudes and latitudes, values close to a rounding tie (x.xx5), arbitrary doubles and large values"""
+    rnd = random.Random(seed)
+    values = []
+    for _ in range(count):
+        kind = rnd.random()
+        if kind < 0.3:
+            values.append(rnd.uniform(-180, 180))
+        elif kind < 0.5:
+            values.append(round(rnd.uniform(-180, 180), 3))
+        elif kind < 0.6:
+            values.append(rnd.randint(-18000, 18000) / 100 + rnd.choice([0.005, -0.005, 0.0049999999999, 0.00500000001]))
+        elif kind < 0.7:
+            values.append(struct.unpack('<d', struct.pack('<Q', rnd.getrandbits(64)))[0])
+        else:
+            values.append(rnd.uniform(-1e7, 1e7))
+    return values
+
+
+def assert_rounded_like_round(values, ndigits):
+    array = numpy.array(values, dtype=numpy.float64).reshape(-1, 4)
+    rounded = round_array(array, ndigits)
+    # repr tells -0.0 from 0.0 and matches nan
+    assert [[repr(value) for value in row] for row in rounded] == [[repr(round(value, ndigits)) for value in row] for row in array.tolist()]
+    assert all(type(value) is float for row in rounded for value in row)
+
+
+@pytest.mark.parametrize('ndigits', [0, 2, 3, 6])
+def test_round_array_matches_round(ndigits):
+    assert_rounded_like_round(random_coordinates(40000), ndigits)
+
+
+def test_round_array_special_values():
+    assert_rounded_like_round(SPECIAL_VALUES, 2)
+
+
+def test_bbox_polygons_array_matches_lists():
+    bboxes = [random_coordinates(4, seed) for seed in range(500)] + [SPECIAL_VALUES[i:i + 4] for i in range(0, len(SPECIAL_VALUES), 4)]
+    from_array = bbox_polygons(numpy.array(bboxes, dtype=numpy.float64))
+    from_lists = bbox_polygons(bboxes)
+    assert repr(from_array) == repr(from_lists)
+
+
+def test_bbox_polygons_geometry_and_wkt():
+    coordinates, wkts = bbox_polygons([[-100.004, 50.004, -98.996, 51.0]])
+    assert coordinates == [[[[-100.0, 50.0], [-99.0, 50.0], [-99.0, 51.0], [-100.0, 51.0], [-100.0, 50.0]]]]
+    assert wkts == ['POLYGON((-100.0 50.0, -99.0 50.0, -99.0 51.0, -100.0 51.0, -100.0 50.0))']
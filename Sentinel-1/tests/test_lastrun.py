@@ -0,0 +1,148 @@
+"""lastRun reconciliation: stale lists of the processor, run-wide deletes of the gather function
+
+An item is only deleted once every page of the harvest is done and no page logged it. A page that failed keeps the
+items of its previous lastRun, whatever the failure (fetch, mapping of one item, upload), so nothing is deleted.
+"""
+import json
+import pathlib
+
+import pytest
+
+import lastrun
+import processor
+
+TEMPLATE_BUCKET = processor.geocore_template_bucket_name
+DATA_BUCKET = processor.processed_data_bucket_name
+
+
+def lines(s3, bucket, key):
+    return s3.bucket(bucket)[key].decode('utf-8').splitlines()
+
+
+# reconcile_lastrun(): stale list of a page
+@pytest.fixture
+def local_lastrun(monkeypatch):
+    """Local lastRun of the current harvest, the processor writes and uploads its lastRun files from /tmp"""
+    monkeypatch.chdir('/tmp')
+    path = pathlib.Path('/tmp/lastRun_eodms_sentinel-1_0.txt')
+    path.write_text('a.geojson\th1\n')
+    yield path
+    path.unlink()
+
+
+def test_reconcile_lastrun_uploads_stale_list(s3, local_lastrun):
+    previous_items = {'a.geojson': 'h1', 'b.geojson': 'h2', 'c.geojson': None}
+    stale, e = processor.reconcile_lastrun(local_lastrun.name, previous_items, {'a.geojson': 'h1'})
+    assert (stale, e) == (2, None)
+    assert lines(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.stale.txt') == ['b.geojson', 'c.geojson']
+    assert local_lastrun.read_text() == 'a.geojson\th1\n'
+
+
+def test_reconcile_lastrun_keeps_previous_items_of_incomplete_harvest(s3, local_lastrun):
+    previous_items = {'a.geojson': 'h1', 'b.geojson': 'h2', 'c.geojson': None}
+    stale, e = processor.reconcile_lastrun(local_lastrun.name, previous_items, {'a.geojson': 'h1'}, keep_previous=True)
+    assert (stale, e) == (0, None)
+    assert TEMPLATE_BUCKET not in s3.buckets
+    assert local_lastrun.read_text() == 'a.geojson\th1\nb.geojson\th2\nc.geojson\n'
+
+
+def test_reconcile_lastrun_keeps_previous_items_if_stale_list_fails(s3, local_lastrun, monkeypatch):
+    monkeypatch.setattr(processor, 'upload_file_s3', lambda **kwargs: False)
+    stale, e = processor.reconcile_lastrun(local_lastrun.name, {'a.geojson': 'h1', 'b.geojson': 'h2'}, {'a.geojson': 'h1'})
+    assert stale == 0 and 'lastRun_eodms_sentinel-1_0.stale.txt' in e
+    assert local_lastrun.read_text() == 'a.geojson\th1\nb.geojson\th2\n'
+
+
+def test_reconcile_lastrun_without_stale_items(s3, local_lastrun):
+    assert processor.reconcile_lastrun(local_lastrun.name, {'a.geojson': 'h1'}, {'a.geojson': 'h1'}) == (0, None)
+    assert TEMPLATE_BUCKET not in s3.buckets
+
+
+# reconcile_harvest(): deletes of the gather function
+def put(s3, bucket, key, body='{}'):
+    s3.bucket(bucket)[key] = body.encode('utf-8')
+
+
+def test_reconcile_harvest_keeps_items_moved_to_another_page(s3):
+    for key in ['a', 'b', 'c', 'd']:
+        put(s3, DATA_BUCKET, key)
+    # c and d moved from page 0 to page 1 since the previous harvest, b is gone
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt', 'a\th\n')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.stale.txt', 'b\nc\nd\n')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_1.txt', 'c\nd\n')
+    current_items, stale, e = lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 2)
+    assert (sorted(current_items), stale, e) == (['a', 'c', 'd'], 1, None)
+    assert sorted(s3.bucket(DATA_BUCKET)) == ['a', 'c', 'd']
+    assert sorted(s3.bucket(TEMPLATE_BUCKET)) == ['lastRun_eodms_sentinel-1_0.txt', 'lastRun_eodms_sentinel-1_1.txt']
+
+
+def test_reconcile_harvest_deletes_pages_past_the_last_one(s3):
+    for key in ['a', 'b', 'c', 'd']:
+        put(s3, DATA_BUCKET, key)
+    # PAGE_LIMIT was raised since the previous harvest, page 2 is past the last one and its item c moved to page 1
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt', 'a\n')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_1.txt', 'c\n')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_2.txt', 'c\nd\n')
+    # another collection whose name starts like this one
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1-ard_0.txt', 'b\n')
+    current_items, stale, e = lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 2)
+    assert (sorted(current_items), stale, e) == (['a', 'c'], 1, None)
+    assert sorted(s3.bucket(DATA_BUCKET)) == ['a', 'b', 'c']
+    assert sorted(s3.bucket(TEMPLATE_BUCKET)) == [
+        'lastRun_eodms_sentinel-1-ard_0.txt', 'lastRun_eodms_sentinel-1_0.txt', 'lastRun_eodms_sentinel-1_1.txt'
+        ]
+
+
+def test_reconcile_harvest_deletes_nothing_if_a_lastrun_is_unreadable(s3, monkeypatch):
+    put(s3, DATA_BUCKET, 'b')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt', 'a\n')
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.stale.txt', 'b\n')
+    monkeypatch.setattr(lastrun, 'open_file_s3', lambda bucket, key: False if key.endswith('_0.txt') else s3.bucket(bucket)[key].decode())
+    with pytest.raises(ValueError):
+        lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 1)
+    assert sorted(s3.bucket(DATA_BUCKET)) == ['b']
+    assert len(s3.bucket(TEMPLATE_BUCKET)) == 2
+
+
+# process_page(): the stale list is only written by a harvest without any error
+def test_process_page_lists_stale_items(s3, harvest):
+    assert harvest() == ('', False)
+    assert lines(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.stale.txt') == ['old-0.geojson', 'old-1.geojson']
+    logged = [line.split('\t')[0] for line in lines(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt')]
+    assert len(logged) == 10 and 'old-0.geojson' not in logged
+    # nothing is deleted before the gather function
+    assert {'old-0.geojson', 'old-1.geojson'} <= set(s3.bucket(DATA_BUCKET))
+    lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 1)
+    assert sorted(s3.bucket(DATA_BUCKET)) == sorted(logged)
+
+
+@pytest.mark.parametrize('failure', ['missing title', 'fetch'])
+def test_process_page_error_keeps_previous_items(s3, harvest, stac_fixture, failure):
+    page = json.loads(json.dumps(dict(stac_fixture['items'], features=stac_fixture['items']['features'][:10])))
+    if failure == 'missing title':
+        del page['features'][5]['properties']['title']
+    error_msg, continued = harvest(page, status_code=503 if failure == 'fetch' else 200)
+    assert error_msg and not continued
+    assert 'lastRun_eodms_sentinel-1_0.stale.txt' not in s3.bucket(TEMPLATE_BUCKET)
+    logged = [line.split('\t')[0] for line in lines(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt')]
+    assert {'old-0.geojson', 'old-1.geojson'} <= set(logged)
+    lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 1)
+    assert {'old-0.geojson', 'old-1.geojson'} <= set(s3.bucket(DATA_BUCKET))
+
+
+@pytest.mark.parametrize('unreadable', ['lastRun_eodms_sentinel-1_0.txt', 'lastRun_eodms_sentinel-1_0.partial.txt'])
+def test_process_page_unreadable_lastrun_is_retried(s3, harvest, stac_fixture, unreadable):
+    # a continuation at item 5, the checkpoint logs the items uploaded by the first part of the page
+    item_names = [f"eodms-{feature['collection']}-{feature['id']}.geojson" for feature in stac_fixture['items']['features'][:10]]
+    for item_name in item_names:
+        put(s3, DATA_BUCKET, item_name)
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.txt', ''.join(f'{item_name}\n' for item_name in item_names))
+    put(s3, TEMPLATE_BUCKET, 'lastRun_eodms_sentinel-1_0.partial.txt', ''.join(f'{item_name}\n' for item_name in item_names[:5]))
+    previous = dict(s3.bucket(TEMPLATE_BUCKET))
+    s3.failing.add(unreadable)
+    with pytest.raises(ValueError, match=unreadable):
+        harvest(offset=5)
+    s3.failing.clear()
+    assert s3.bucket(TEMPLATE_BUCKET) == previous
+    lastrun.reconcile_harvest(TEMPLATE_BUCKET, DATA_BUCKET, 'sentinel-1', 1)
+    assert set(item_names) <= set(s3.bucket(DATA_BUCKET))
@@ -0,0 +1,59 @@
+"""MappingPool: page order across the worker processes, and failures of a worker"""
+import json
+
+import pytest
+
+import mapping_pool
+import processor
+from fast_datetime import parse_datetime
+from mapping_pool import MappingPool
+
+TEMPLATE_BUCKET = processor.geocore_template_bucket_name
+
+DATETIMES = [f'2023-01-{day:02d}T10:20:30.{day}Z' for day in range(1, 29)]
+
+
+def map_datetime(value):
+    """Item of the pool tests: the name and the date of a datetime string, None (skipped) for the 7th of the month"""
+    date = parse_datetime(value)
+    return None if date.day == 7 else (value, {'date': date.strftime('%Y-%m-%d')})
+
+
+def serialize(json_data):
+    return json.dumps(json_data).encode('utf-8')
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_results_in_page_order(batched):
+    map_batch = (lambda values: [map_datetime(value) for value in values]) if batched else None
+    pool = MappingPool(DATETIMES, map_item=map_datetime, serialize=serialize, workers=3, batch_size=4, map_batch=map_batch)
+    expected = [None if value[8:10] == '07' else (value, serialize({'date': value[:10]})) for value in DATETIMES]
+    assert list(pool.results()) == expected
+    assert pool.processes == []
+
+
+def test_worker_exception_is_raised_with_its_traceback():
+    values = DATETIMES[:10] + ['2023-13-01T10:20:30.1Z'] + DATETIMES[10:]
+    pool = MappingPool(values, map_item=map_datetime, serialize=serialize, workers=3, batch_size=2)
+    yielded = []
+    with pytest.raises(RuntimeError, match="ValueError: time data '2023-13-01T10:20:30.1Z'") as e:
+        for mapped in pool.results():
+            yielded.append(mapped)
+    assert 'Mapping worker 1 failed' in str(e.value)
+    # the pool fails as soon as a worker reports its error, the items yielded before are in page order
+    assert len(yielded) < 10 and [mapped[0] for mapped in yielded if mapped] == [value for value in DATETIMES[:len(yielded)] if value[8:10] != '07']
+    assert pool.processes == [] and pool.connections == []
+
+
+def test_process_page_worker_exception_keeps_previous_items(s3, harvest, stac_fixture, monkeypatch):
+    # MAPPING_WORKERS, read by the processor and by the pool
+    monkeypatch.setattr(processor, 'mapping_workers', 2)
+    monkeypatch.setattr(mapping_pool, 'mapping_workers', 2)
+    page = json.loads(json.dumps(dict(stac_fixture['items'], features=stac_fixture['items']['features'][:10])))
+    # not a string, parse_datetime fails in the mapping worker of the item
+    page['features'][5]['properties']['datetime'] = 20230101
+    error_msg, continued = harvest(page, use_mapping_pool=True)
+    assert 'Failed to map the item page' in error_msg and 'Mapping worker 1 failed' in error_msg and not continued
+    logged = [line.split('\t')[0] for line in s3.bucket(TEMPLATE_BUCKET)['lastRun_eodms_sentinel-1_0.txt'].decode('utf-8').splitlines()]
+    assert {'old-0.geojson', 'old-1.geojson'} <= set(logged)
+    assert 'lastRun_eodms_sentinel-1_0.stale.txt' not in s3.bucket(TEMPLATE_BUCKET)
@@ -0,0 +1,151 @@
+"""fetch → map → upload pipeline: results, stop before the deadline, errors of the stages"""
+import threading
+import time
+
+import pytest
+
+import processor
+from pipeline import run_pipeline
+
+TEMPLATE_BUCKET = processor.geocore_template_bucket_name
+
+
+class Source:
+    """Items 0..count-1, records how many were taken and whether the source was closed"""
+
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.taken = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.taken == self.fail_at:
+            raise ConnectionError('connection reset')
+        if self.taken >= self.count:
+            raise StopIteration
+        self.taken += 1
+        return self.taken - 1
+
+    def close(self):
+        self.closed = True
+
+
+def stop_after(mapped, count):
+    return lambda: len(mapped) >= count
+
+
+def closed(source):
+    # After an error the fetch thread is not joined, it closes the source once it sees the pipeline stopped
+    for _ in range(100):
+        if source.closed:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_maps_every_item_in_order():
+    mapped = []
+    count, completed = run_pipeline(Source(1000), lambda item: None if item % 7 == 0 else item * 10, mapped.append, queue_size=4)
+    assert (count, completed) == (1000, True)
+    assert mapped == [item * 10 for item in range(1000) if item % 7]
+
+
+def test_should_stop_leaves_the_rest_in_the_source():
+    source, mapped = Source(1000), []
+    count, completed = run_pipeline(source, lambda item: item, mapped.append, queue_size=4, should_stop=stop_after(mapped, 5))
+    assert (count, completed, mapped) == (5, False, [0, 1, 2, 3, 4])
+    # the fetch stage stopped too, the next invocation resumes at item count
+    assert source.closed and source.taken < 1000
+
+
+def test_should_stop_between_batches():
+    mapped = []
+    count, completed = run_pipeline(
+        Source(100), None, mapped.append, should_stop=stop_after(mapped, 8),
+        map_batch=lambda batch: [item for item in batch], batch_size=4
+        )
+    assert (count, completed, mapped) == (8, False, list(range(8)))
+
+
+@pytest.mark.parametrize('stage', ['map', 'sink'])
+def test_map_or_sink_error_stops_the_fetch(stage):
+    def fail_at_3(item):
+        if item == 3:
+            raise KeyError('title')
+        return item
+    source, mapped = Source(1000), []
+    with pytest.raises(KeyError):
+        if stage == 'map':
+            run_pipeline(source, fail_at_3, mapped.append, queue_size=4)
+        else:
+            run_pipeline(source, lambda item: item, lambda item: mapped.append(fail_at_3(item)), queue_size=4)
+    assert mapped == [0, 1, 2]
+    assert closed(source) and source.taken < 1000
+
+
+def test_fetch_error_is_raised_after_the_items_fetched_before_it():
+    mapped = []
+    with pytest.raises(ConnectionError):
+        run_pipeline(Source(1000, fail_at=3), lambda item: item, mapped.append)
+    assert mapped == [0, 1, 2]
+
+
+def test_stalled_fetch_stops_at_the_deadline():
+    # The fetch stalls after 3 items, like a response that sends no more data, until its read timeout
+    read_timeout = threading.Event()
+    deadline = time.monotonic() + 0.5
+
+    def source():
+        yield from range(3)
+        read_timeout.wait(10)
+        raise TimeoutError('read timeout')
+
+    def should_stop():
+        if time.monotonic() < deadline:
+            return False
+        read_timeout.set()
+        return True
+
+    mapped = []
+    started = time.monotonic()
+    count, completed = run_pipeline(source(), lambda item: item * 10, mapped.append, should_stop=should_stop)
+    assert (count, completed, mapped) == (3, False, [0, 10, 20])
+    assert time.monotonic() - started < 5
+
+
+class Context:
+    """Lambda context with time left for the first checks of the deadline, then below DEADLINE_MARGIN_MS"""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def get_remaining_time_in_millis(self):
+        self.checks -= 1
+        return 900000 if self.checks >= 0 else 0
+
+
+def lastrun_names(s3, key):
+    return [line.split('\t')[0] for line in s3.bucket(TEMPLATE_BUCKET)[key].decode('utf-8').splitlines()]
+
+
+def test_deadline_continues_the_page(s3, harvest, stac_fixture):
+    item_names = [f"eodms-{feature['collection']}-{feature['id']}.geojson" for feature in stac_fixture['items']['features'][:10]]
+    previous_lastrun = s3.bucket(TEMPLATE_BUCKET)['lastRun_eodms_sentinel-1_0.txt']
+    assert harvest(context=Context(4)) == ('', True)
+    # the items mapped before the deadline are uploaded and checkpointed, the rest of the page is queued
+    [message] = harvest.messages
+    offset = message['offset']
+    assert message['index'] == 0 and 0 < offset < 10
+    assert lastrun_names(s3, 'lastRun_eodms_sentinel-1_0.partial.txt') == item_names[:offset]
+    assert s3.bucket(TEMPLATE_BUCKET)['lastRun_eodms_sentinel-1_0.txt'] == previous_lastrun
+    assert 'lastRun_eodms_sentinel-1_0.stale.txt' not in s3.bucket(TEMPLATE_BUCKET)
+
+    assert harvest(offset=offset) == ('', False)
+    assert lastrun_names(s3, 'lastRun_eodms_sentinel-1_0.txt') == item_names
+    assert lastrun_names(s3, 'lastRun_eodms_sentinel-1_0.stale.txt') == ['old-0.geojson', 'old-1.geojson']
+    assert 'lastRun_eodms_sentinel-1_0.partial.txt' not in s3.bucket(TEMPLATE_BUCKET)
+    assert len(harvest.messages) == 1
@@ -0,0 +1,58 @@
+"""process_record(): SQS retries of a page and the give-up after MAX_RECEIVE_COUNT deliveries"""
+import json
+
+import pytest
+
+import processor
+
+MAX_RECEIVE_COUNT = processor.max_receive_count
+
+
+def record(receive_count):
+    body = {"item-api": "https://api.test/stac/collections/sentinel-1/items?limit=5000", "index": 0, "item_state": {"process_id": "0"}}
+    return {"messageId": "m1", "body": json.dumps(body), "attributes": {"ApproximateReceiveCount": str(receive_count)}}
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Record the pages processed and the pages marked finished, process_page returns the result of pages['result']"""
+    calls = {'processed': 0, 'finished': [], 'result': ('', False)}
+
+    def process_page(json_body, context=None, use_mapping_pool=True):
+        calls['processed'] += 1
+        if isinstance(calls['result'], Exception):
+            raise calls['result']
+        return calls['result']
+    monkeypatch.setattr(processor, 'process_page', process_page)
+    monkeypatch.setattr(processor, 'update_item_finished', lambda table_name, item_state: calls['finished'].append(item_state))
+    return calls
+
+
+def test_success_finishes_the_page(pages):
+    assert processor.process_record(record(1), None) == ''
+    assert pages['processed'] == 1 and pages['finished'] == [{"process_id": "0"}]
+
+
+@pytest.mark.parametrize('result', [('Failed to map the item page\n', False), ValueError('Failed to read lastRun')])
+def test_failed_page_is_retried(pages, result):
+    pages['result'] = result
+    assert processor.process_record(record(MAX_RECEIVE_COUNT - 1), None)
+    assert pages['finished'] == []
+
+
+def test_failed_page_is_given_up_at_the_last_delivery(pages):
+    pages['result'] = ('Failed to map the item page\n', False)
+    assert processor.process_record(record(MAX_RECEIVE_COUNT), None) == ''
+    assert pages['finished'] == [{"process_id": "0"}]
+
+
+def test_continued_page_is_finished_by_its_last_part(pages):
+    pages['result'] = ('', True)
+    assert processor.process_record(record(1), None) == ''
+    assert pages['finished'] == []
+
+
+def test_page_that_never_returned_is_given_up_without_processing(pages):
+    # e.g. the page hit the Lambda timeout at every delivery, process_record never got its result
+    assert processor.process_record(record(MAX_RECEIVE_COUNT + 1), None) == ''
+    assert pages['processed'] == 0 and pages['finished'] == [{"process_id": "0"}]
@@ -0,0 +1,97 @@
+"""stream_json readers against json.loads of the whole document
+
+The documents are split in chunks of every size from one byte up, so tokens (strings, escapes, numbers, multi-byte
+UTF-8 characters) are cut at every position, like the chunks of response.iter_content().
+"""
+import json
+import os
+import random
+
+import pytest
+
+from stream_json import iter_json_array, read_json_fields
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+CHUNK_SIZES = [1, 2, 3, 7, 64, 65536]
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def random_value(rnd, depth=0):
+    kind = rnd.randint(0, 7 if depth < 3 else 4)
+    if kind == 0:
+        return rnd.randint(-10**6, 10**6)
+    if kind == 1:
+        return rnd.uniform(-200, 200)
+    if kind == 2:
+        return rnd.choice(['a"b', 'c\\d', 'éè漢字', '\\', '"', '', 'x\\"y', 'ends\\', ' ', 'tab\there'])
+    if kind == 3:
+        return rnd.choice([True, False, None])
+    if kind == 4:
+        return 'plain'
+    if kind in (5, 6):
+        return [random_value(rnd, depth + 1) for _ in range(rnd.randint(0, 4))]
+    return {rnd.choice(['k', 'é"', '[', '{}', 'x\\']) + str(i): random_value(rnd, depth + 1) for i in range(rnd.randint(0, 4))}
+
+
+def random_documents(count, seed=7):
+    """STAC-like pages: the members in any order, features of any JSON values, with or without indentation"""
+    rnd = random.Random(seed)
+    for _ in range(count):
+        keys = ['type', 'features', 'links', 'context', 'numberMatched']
+        rnd.shuffle(keys)
+        doc = {}
+        for key in keys:
+            if key == 'features':
+                doc[key] = [random_value(rnd) for _ in range(rnd.randint(0, 6))]
+            elif key == 'numberMatched':
+                doc[key] = rnd.randint(0, 10**9)
+            else:
+                doc[key] = random_value(rnd)
+        text = json.dumps(doc, ensure_ascii=rnd.random() < 0.5, indent=rnd.choice([None, 2]))
+        yield text.encode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def stac_page():
+    with open(os.path.join(DATA, 'stac_fixture.json'), encoding='utf-8') as f:
+        return json.dumps(json.load(f)['items'], indent=2, ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_features_match_json_loads(stac_page, size):
+    assert list(iter_json_array(split(stac_page, size), 'features')) == json.loads(stac_page)['features']
+
+
+@pytest.mark.parametrize('start', [0, 1, 13, 25, 26, 100])
+def test_features_from_start_match_json_loads(stac_page, start):
+    assert list(iter_json_array(split(stac_page, 7), 'features', start)) == json.loads(stac_page)['features'][start:]
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_fields_match_json_loads(stac_page, size):
+    page = json.loads(stac_page)
+    assert read_json_fields(split(stac_page, size), ('context', 'links')) == {'context': page['context'], 'links': page['links']}
+
+
+def test_random_documents_match_json_loads():
+    for data in random_documents(300):
+        doc = json.loads(data)
+        for size in CHUNK_SIZES:
+            assert list(iter_json_array(split(data, size), 'features')) == doc['features']
+            assert read_json_fields(split(data, size), ('context', 'links')) == {'context': doc['context'], 'links': doc['links']}
+            assert read_json_fields(split(data, size), ('numberMatched',)) == {'numberMatched': doc['numberMatched']}
+
+
+def test_missing_members():
+    assert list(iter_json_array([b'{"type": "FeatureCollection"}'], 'features')) == []
+    assert read_json_fields([b'{"type": "FeatureCollection"}'], ('context',)) == {}
+
+
+@pytest.mark.parametrize('data', [b'{"features": [1, 2', b'{"features": [1 2]}', b'{"features": [{"a": "x}]}', b'{"features": [tru]}', b'[1]'])
+def test_invalid_documents_raise(data):
+    for size in (1, len(data)):
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array(split(data, size), 'features'))
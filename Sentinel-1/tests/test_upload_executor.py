@@ -0,0 +1,83 @@
+"""UploadExecutor: bounded concurrent PUTs, completions in submission order, failed uploads; unchanged items skipped"""
+import threading
+import time
+
+import processor
+import upload_executor
+from upload_executor import UploadExecutor
+
+TEMPLATE_BUCKET = processor.geocore_template_bucket_name
+DATA_BUCKET = processor.processed_data_bucket_name
+
+
+def test_completions_in_submission_order_with_bounded_puts(monkeypatch):
+    lock = threading.Lock()
+    in_flight = {'now': 0, 'max': 0}
+
+    def upload_file_s3(filename, bucket, json_data, object_name=None, s3_client=None, content_encoding=None):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        # the first uploads are the slowest, they finish after the next ones
+        time.sleep(0.05 if int(filename) < 3 else 0.001)
+        with lock:
+            in_flight['now'] -= 1
+        return True
+    monkeypatch.setattr(upload_executor, 'upload_file_s3', upload_file_s3)
+
+    logged = []
+    with UploadExecutor('bucket', max_in_flight=4, on_success=lambda index, filename: logged.append((index, filename))) as uploader:
+        for i in range(40):
+            uploader.submit(str(i), b'{}')
+    assert logged == [(i, str(i)) for i in range(40)]
+    assert in_flight['max'] <= 4
+    assert (uploader.submitted, uploader.succeeded, uploader.failures) == (40, 40, [])
+
+
+def test_failed_uploads_are_reported_and_not_logged(s3, monkeypatch):
+    s3.failing.add('b.geojson')
+    real_upload = upload_executor.upload_file_s3
+
+    def upload_file_s3(filename, *args, **kwargs):
+        if filename == 'd.geojson':
+            raise OSError('connection reset')
+        return real_upload(filename, *args, **kwargs)
+    monkeypatch.setattr(upload_executor, 'upload_file_s3', upload_file_s3)
+
+    logged = []
+    with UploadExecutor(DATA_BUCKET, max_in_flight=2, on_success=lambda index, filename: logged.append(filename)) as uploader:
+        for filename in ['a.geojson', 'b.geojson', 'c.geojson', 'd.geojson', 'e.geojson']:
+            uploader.submit(filename, {'id': filename})
+    assert logged == ['a.geojson', 'c.geojson', 'e.geojson']
+    assert sorted(s3.bucket(DATA_BUCKET)) == ['a.geojson', 'c.geojson', 'e.geojson']
+    assert [(index, filename) for index, filename, e in uploader.failures] == [(1, 'b.geojson'), (3, 'd.geojson')]
+    assert isinstance(uploader.failures[1][2], OSError)
+    assert uploader.succeeded == 3
+
+
+def lastrun_items(s3, key):
+    return dict(line.split('\t') for line in s3.bucket(TEMPLATE_BUCKET)[key].decode('utf-8').splitlines())
+
+
+def test_process_page_failed_upload_keeps_previous_items(s3, harvest, stac_fixture):
+    item_names = [f"eodms-{feature['collection']}-{feature['id']}.geojson" for feature in stac_fixture['items']['features'][:10]]
+    s3.failing.add(item_names[4])
+    error_msg, continued = harvest()
+    assert f'Failed to upload item 4 {item_names[4]}' in error_msg and not continued
+    logged = lastrun_items(s3, 'lastRun_eodms_sentinel-1_0.txt')
+    assert item_names[4] not in logged and set(item_names) - set(logged) == {item_names[4]}
+    # the previous items stay tracked, nothing is listed for the gather function to delete
+    assert {'old-0.geojson', 'old-1.geojson'} <= set(logged)
+    assert 'lastRun_eodms_sentinel-1_0.stale.txt' not in s3.bucket(TEMPLATE_BUCKET)
+
+
+def test_process_page_skips_unchanged_items(s3, harvest):
+    assert harvest() == ('', False)
+    first_lastrun = lastrun_items(s3, 'lastRun_eodms_sentinel-1_0.txt')
+    # mark the uploaded bodies, a second harvest of the same items must not PUT them again
+    data = s3.bucket(DATA_BUCKET)
+    for item_name in first_lastrun:
+        data[item_name] = b'not uploaded again'
+    assert harvest() == ('', False)
+    assert lastrun_items(s3, 'lastRun_eodms_sentinel-1_0.txt') == first_lastrun
+    assert all(data[item_name] == b'not uploaded again' for item_name in first_lastrun)